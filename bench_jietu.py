@@ -0,0 +1,285 @@
+import argparse
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+import tracemalloc
+from contextlib import redirect_stdout
+from io import StringIO
+from openpyxl import Workbook
+from openpyxl.styles import PatternFill
+from openpyxl.utils import get_column_letter
+import numpy as np
+import jietu
+'''jietu截图流程基准测试: 生成合成底片、All_Info签字列表和带标红行的工作簿, 无需真实底片和GPU'''
+# ==================== 默认参数 ====================
+DEFAULT_ROWS = 1000          # 工作簿数据行数
+DEFAULT_RED_DENSITY = 0.3    # 标红行比例
+DEFAULT_WELDS = 50           # 焊口(底片)数量
+DEFAULT_FILM_WIDTH = 12000   # 底片宽度(像素)
+DEFAULT_FILM_HEIGHT = 1200   # 底片高度(像素)
+SIGN_SPACING_PX = 370        # 相邻签字的像素间距, 与样例All_Info接近
+SIGN_STEP = 5                # 相邻签字的数值间隔
+DIGIT_MULTIPLIER = 10        # 签字倍数
+# ==================================================
+
+HEADERS = ['评判类型', '焊口编号', '缺陷性质', '起始位置', '结束位置', '点数/长度', '截图', '级别']
+RED_FILL = PatternFill(start_color='FF0000', end_color='FF0000', fill_type='solid')
+GREEN_FILL = PatternFill(start_color='00FF00', end_color='00FF00', fill_type='solid')
+
+def film_seam(height):
+    """合成底片的焊缝上/下边界"""
+    return int(height * 0.4), int(height * 0.6)
+
+def make_film(width, height, seed):
+    """生成16位灰度合成底片: 背景噪声 + 焊缝亮带 + 若干暗点缺陷"""
+    rng = np.random.default_rng(seed)
+    film = rng.normal(20000, 1500, size=(height, width)).astype(np.float32)
+    seam_top, seam_bottom = film_seam(height)
+    film[seam_top:seam_bottom] += 15000
+    for _ in range(20):
+        x = int(rng.integers(0, width - 20))
+        y = int(rng.integers(seam_top, seam_bottom - 20))
+        film[y:y + 20, x:x + 20] -= 8000
+    np.clip(film, 0, 65535, out=film)
+    return film.astype(np.uint16)
+
+def make_all_info(file_name, width, height, seed):
+    """
+    生成与模块文档中样例形状一致的All_Info: [文件名, digits_info, 倍数]
+    签字位于焊缝下方, 每隔几个签字会在相邻位置重复出现一次(与真实底片的搭接一致)
+    """
+    rng = random.Random(seed)
+    seam_top, seam_bottom = film_seam(height)
+    sign_y = seam_bottom + (height - seam_bottom) / 2.0
+    digits_info = []
+    value = 0
+    x = 70.0
+    while x < width - 50:
+        center = [x, sign_y + rng.uniform(-20, 20)]
+        # 样例中偶尔出现tuple形式的center
+        if rng.random() < 0.05:
+            center = tuple(center)
+        digits_info.append({'center': center, 'digit': value, 'score': rng.uniform(0.85, 1.0)})
+        if value and value % (SIGN_STEP * 3) == 0 and x + SIGN_SPACING_PX * 2.5 < width:
+            x += SIGN_SPACING_PX * 2.5
+            digits_info.append({'center': [x, sign_y + rng.uniform(-20, 20)], 'digit': value,
+                                'score': rng.uniform(0.85, 1.0)})
+        value += SIGN_STEP
+        x += SIGN_SPACING_PX + rng.uniform(-10, 10)
+    return [file_name, digits_info, DIGIT_MULTIPLIER]
+
+def make_workbook(path, rows, red_density, welds, film_length_mm, seed):
+    """生成带颜色标记的工作簿, 结构与ExcelComparer的输出一致"""
+    rng = random.Random(seed)
+    wb = Workbook()
+    ws = wb.active
+    ws.title = 'Sheet1'
+    ws.append(HEADERS)
+    weld_ids = [f"BENCH-AC{i:04d}-X01" for i in range(welds)]
+    for r in range(2, rows + 2):
+        weld_id = weld_ids[rng.randrange(welds)]
+        start = rng.uniform(0, film_length_mm * 0.9)
+        end = min(film_length_mm * 0.95, start + rng.uniform(5, 60))
+        ws.append(['人工评判', weld_id, '条形缺陷', round(start, 1), round(end, 1), '10', None, 'Ⅲ'])
+        fill = RED_FILL if rng.random() < red_density else GREEN_FILL
+        for col in range(1, 9):
+            ws.cell(row=r, column=col).fill = fill
+    wb.save(path)
+    return weld_ids
+
+class SyntheticHost:
+    """模拟GUI宿主: process()按焊口编号生成合成底片, 识别结果由ReplayRecognizer从录制文件读取"""
+
+    def __init__(self, excel_path, dcm_path, record_dir, film_width, film_height):
+        self.excel_path = excel_path
+        self.dcm_path = dcm_path
+        self.pix_lenth = 0.1
+        self.film_width = film_width
+        self.film_height = film_height
+        self.recognizer = jietu.ReplayRecognizer(record_dir)
+        self.film_locator = jietu.FilmLocator(dcm_path)
+        self.film_locator.scan()
+        # 只生成一张基础底片, 各焊口在其上平移得到, 模拟解码时的整幅分配与拷贝
+        self._base_film = make_film(film_width, film_height, 0)
+
+    def process(self, file_path):
+        shift = sum(os.path.basename(file_path).encode()) % self.film_width
+        self.yuan_juzhen = np.roll(self._base_film, shift, axis=1)
+        self.hanfeng_start, self.hanfeng_end = film_seam(self.film_height)
+
+def prepare(work_dir, args):
+    """生成底片占位文件、回放记录和工作簿"""
+    dcm_dir = os.path.join(work_dir, 'films')
+    record_dir = os.path.join(work_dir, 'records')
+    os.makedirs(dcm_dir, exist_ok=True)
+    os.makedirs(record_dir, exist_ok=True)
+
+    film_length_mm = (args.film_width / SIGN_SPACING_PX) * SIGN_STEP * DIGIT_MULTIPLIER
+    excel_path = os.path.join(work_dir, 'bench.xlsx')
+    weld_ids = make_workbook(excel_path, args.rows, args.red_density, args.welds, film_length_mm, args.seed)
+
+    for weld_id in weld_ids:
+        film_path = os.path.join(dcm_dir, weld_id + '.DICONDE')
+        open(film_path, 'wb').close()
+        all_info = make_all_info(film_path, args.film_width, args.film_height, weld_id)
+        with open(jietu.replay_record_path(record_dir, film_path), 'w', encoding='utf-8') as f:
+            json.dump(all_info, f)
+
+    return SyntheticHost(excel_path, dcm_dir, record_dir, args.film_width, args.film_height)
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    return float(np.percentile(values, q))
+
+def bench_stages(host):
+    """按阶段计时: 每行的签字解析、签字对查找、裁剪矩形、裁剪渲染编码、插入, 以及最终保存"""
+    from openpyxl import load_workbook
+
+    wb = load_workbook(host.excel_path)
+    ws = wb.active
+    headers = jietu.read_headers(ws)
+    col_shot = get_column_letter(headers[jietu.COL_SCREENSHOT])
+    red_rows = [r for r in range(2, ws.max_row + 1) if jietu.is_row_red(ws, r)]
+
+    renderer = jietu.CropRenderer()
+    embedder = jietu.ImageEmbedder()
+    embedder.expected = len(red_rows)
+    timings = {name: [] for name in ('decode', 'recognize', 'parse_digits_info', 'find_sign_pair_for_defect',
+                                     'compute_crop_rect', 'crop_encode', 'add_image')}
+    # 按底片分组, 同一底片只解码、识别一次, 与insert_screenshots一致
+    film_rows = {}
+    for r in red_rows:
+        weld_id = str(ws.cell(row=r, column=headers[jietu.COL_WELD]).value)
+        start_mm = float(ws.cell(row=r, column=headers[jietu.COL_START]).value)
+        end_mm = float(ws.cell(row=r, column=headers[jietu.COL_END]).value)
+        film_rows.setdefault(host.film_locator.find(weld_id), []).append((r, start_mm, end_mm))
+
+    tasks = []
+    for file_path, rows in film_rows.items():
+        tasks.append((file_path, None, None, None))
+        tasks.extend((file_path, r, start_mm, end_mm) for r, start_mm, end_mm in rows)
+
+    film = all_info = None
+    for file_path, r, start_mm, end_mm in tasks:
+        if r is None:
+            film = None
+            t = time.perf_counter()
+            film = jietu.load_film(host, file_path)
+            timings['decode'].append(time.perf_counter() - t)
+            t = time.perf_counter()
+            all_info = host.recognizer.recognize_batch([film])[0]
+            timings['recognize'].append(time.perf_counter() - t)
+            continue
+
+        t = time.perf_counter()
+        sign_dict = jietu.parse_digits_info(all_info[1])
+        timings['parse_digits_info'].append(time.perf_counter() - t)
+
+        t = time.perf_counter()
+        sign_pair = jietu.find_sign_pair_for_defect(sign_dict, start_mm, end_mm, all_info[2])
+        timings['find_sign_pair_for_defect'].append(time.perf_counter() - t)
+        if sign_pair is None:
+            continue
+
+        t = time.perf_counter()
+        left, top, right, bottom = jietu.compute_crop_rect(sign_pair[0], sign_pair[1],
+                                                           film.seam_top, film.seam_bottom)
+        img_h, img_w = film.matrix.shape[:2]
+        left, top = max(0, left), max(0, top)
+        right, bottom = min(img_w, right), min(img_h, bottom)
+        timings['compute_crop_rect'].append(time.perf_counter() - t)
+        if right - left < 5 or bottom - top < 5:
+            continue
+
+        t = time.perf_counter()
+        pil_img = renderer.render(film.matrix[top:bottom, left:right])
+        data = embedder.encode(pil_img)
+        timings['crop_encode'].append(time.perf_counter() - t)
+
+        t = time.perf_counter()
+        ws.row_dimensions[r].height = max(pil_img.size[1] * 0.75, 15)
+        embedder.add(ws, f"{col_shot}{r}", data, pil_img.size)
+        timings['add_image'].append(time.perf_counter() - t)
+
+    out_path = os.path.splitext(host.excel_path)[0] + '_stages.xlsx'
+    with redirect_stdout(StringIO()):
+        save_time = jietu.save_workbook(wb, out_path, embedder)
+    return red_rows, timings, save_time, os.path.getsize(out_path), embedder
+
+def bench_end_to_end(host):
+    """完整运行jietu.run, 返回耗时(秒)"""
+    t = time.perf_counter()
+    with redirect_stdout(StringIO()):
+        jietu.run(host)
+    return time.perf_counter() - t
+
+def main():
+    parser = argparse.ArgumentParser(description='jietu截图流程基准测试(合成底片)')
+    parser.add_argument('--rows', type=int, default=DEFAULT_ROWS, help='工作簿数据行数')
+    parser.add_argument('--red-density', type=float, default=DEFAULT_RED_DENSITY, help='标红行比例')
+    parser.add_argument('--welds', type=int, default=DEFAULT_WELDS, help='焊口(底片)数量')
+    parser.add_argument('--film-width', type=int, default=DEFAULT_FILM_WIDTH, help='底片宽度(像素)')
+    parser.add_argument('--film-height', type=int, default=DEFAULT_FILM_HEIGHT, help='底片高度(像素)')
+    parser.add_argument('--seed', type=int, default=0, help='随机种子')
+    parser.add_argument('--json', help='把结果另存为JSON文件')
+    parser.add_argument('--keep', action='store_true', help='保留生成的临时文件')
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix='bench_jietu_')
+    # jietu会在当前目录下创建TMP_SAVE_DIR, 切换到临时目录运行
+    old_cwd = os.getcwd()
+    os.chdir(work_dir)
+    try:
+        host = prepare(work_dir, args)
+
+        tracemalloc.start()
+        red_rows, timings, save_time, file_size, embedder = bench_stages(host)
+        _, stage_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        tracemalloc.start()
+        total_time = bench_end_to_end(host)
+        _, run_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        n_red = max(1, len(red_rows))
+        print("=" * 80)
+        print(f"行数 {args.rows}, 标红行 {len(red_rows)}, 底片 {args.welds} 张 "
+              f"({args.film_width}x{args.film_height})")
+        print("=" * 80)
+        print(f"{'阶段':<28}{'次数':>8}{'合计(ms)':>12}{'平均(ms)':>12}{'p50(ms)':>10}{'p95(ms)':>10}")
+        result = {'args': vars(args), 'red_rows': len(red_rows), 'stages': {}}
+        for name, values in timings.items():
+            total_ms = sum(values) * 1000
+            mean_ms = total_ms / len(values) if values else 0.0
+            p50 = percentile(values, 50) * 1000
+            p95 = percentile(values, 95) * 1000
+            print(f"{name:<28}{len(values):>8}{total_ms:>12.2f}{mean_ms:>12.3f}{p50:>10.3f}{p95:>10.3f}")
+            result['stages'][name] = {'count': len(values), 'total_ms': total_ms, 'mean_ms': mean_ms,
+                                      'p50_ms': p50, 'p95_ms': p95}
+        print(f"{'save':<28}{1:>8}{save_time * 1000:>12.2f}")
+        print("-" * 80)
+        print(f"分阶段: 峰值内存 {stage_peak / 1024 / 1024:.1f} MB, 输出 {file_size / 1024 / 1024:.2f} MB, "
+              f"{embedder.summary()}")
+        print(f"端到端jietu.run: 总耗时 {total_time:.2f} s, 每标红行 {total_time / n_red * 1000:.2f} ms, "
+              f"峰值内存 {run_peak / 1024 / 1024:.1f} MB")
+
+        result.update({'save_ms': save_time * 1000, 'stage_peak_mb': stage_peak / 1024 / 1024,
+                       'output_mb': file_size / 1024 / 1024, 'run_total_s': total_time,
+                       'run_per_row_ms': total_time / n_red * 1000, 'run_peak_mb': run_peak / 1024 / 1024})
+        if args.json:
+            with open(os.path.join(old_cwd, args.json), 'w', encoding='utf-8') as f:
+                json.dump(result, f, ensure_ascii=False, indent=2)
+    finally:
+        os.chdir(old_cwd)
+        if args.keep:
+            print(f"临时文件保留在: {work_dir}")
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+if __name__ == '__main__':
+    main()
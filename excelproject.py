@@ -1,12 +1,18 @@
+import os
 import pandas as pd
 import re
-from openpyxl import load_workbook
-from openpyxl.styles import PatternFill, Font
+from concurrent.futures import ProcessPoolExecutor
+from openpyxl import Workbook, load_workbook
+from openpyxl.styles import PatternFill, Font, Border, Side, Alignment
 
 # ==================== 配置区域 ====================
 MANUAL_FILE_PATH = r"E:\Desktop\连仪段_施工数字射线检测数据移交模板.xlsx"  # 人工评判标准文件路径
 INTELLIGENT_FILE_PATH = r"E:\Desktop\20251120_143446.xlsx"  # 智能评判结果文件路径
 OUTPUT_FILE_PATH = r"E:\Desktop\excelproject\output_new.xlsx"  # 输出文件路径
+RESULT_DB_PATH = None  # 结果库路径(SQLite), 如 r"E:\Desktop\excelproject\results.db"; None表示不保存
+SHARD_MAX_ROWS = None  # 分片输出时每个分片工作簿的最大记录数, 如 200000; None表示不分片
+SHARD_BY = 'weld'  # 分片方式: 'weld' 按焊口编号范围, 'segment' 先按线路段再按焊口编号范围
+SHARD_WORKERS = None  # 并行写分片的进程数, None表示按CPU核数
 # ==================================================
 
 class ExcelComparer:
@@ -15,6 +21,22 @@ class ExcelComparer:
         self.intelligent_data = None
         self.match_results = []
         self.defect_keywords = ['圆', '条', '未熔合', '未焊透', '裂纹', '内凹', '咬边', '烧穿', '未见']
+        self.position_tolerance = 20  # 起始位置允许误差(mm)
+
+    @property
+    def manual_data(self):
+        return self._manual_data
+
+    @manual_data.setter
+    def manual_data(self, df):
+        # 重新赋值人工数据时清除索引缓存
+        self._manual_data = df
+        self.invalidate_manual_index()
+
+    def invalidate_manual_index(self):
+        """清除人工数据索引缓存; 原地修改manual_data后需调用"""
+        self._manual_index = None
+        self._manual_index_key = None
 
     def find_header_row(self, df):
         """查找表头所在的行"""
@@ -30,32 +52,98 @@ class ExcelComparer:
         df.columns = [str(col).strip().rstrip('*') for col in df.columns]
         return df
 
+    def slice_header(self, raw, header_row):
+        """
+        从header=None读取的数据中切出表头以下部分, 结果与header=header_row重新读取一致:
+        空表头记为"Unnamed: 列号", 重复列名加".1"等后缀, 各列重新推断类型
+        """
+        columns = []
+        seen = {}
+        for i, col in enumerate(raw.iloc[header_row].tolist()):
+            name = f'Unnamed: {i}' if pd.isna(col) else col
+            if name in seen:
+                seen[name] += 1
+                name = f'{name}.{seen[name]}'
+            else:
+                seen[name] = 0
+            columns.append(name)
+
+        df = raw.iloc[header_row + 1:].reset_index(drop=True)
+        df.columns = columns
+        return df.infer_objects()
+
+    def segment_from_path(self, file_path):
+        """从文件名推断线路段, 如 连仪段_施工数字射线检测数据移交模板.xlsx -> 连仪段"""
+        return os.path.splitext(os.path.basename(str(file_path)))[0].split('_')[0]
+
+    def segment_from_sheet(self, file_path, sheet, sheet_name):
+        """
+        从Sheet名推断线路段: 去掉默认Sheet名和分隔符后剩下的部分,
+        如 施工检测缺欠信息表(连仪段) -> 连仪段; 剩余为空时按文件名推断
+        """
+        segment = str(sheet).replace(sheet_name, '').strip(' -_()（）')
+        return segment or self.segment_from_path(file_path)
+
+    def has_weld_header(self, raw, header_row):
+        """表头行是否包含焊口编号"""
+        return len(raw) > header_row and raw.iloc[header_row].astype(str).str.contains('焊口编号').any()
+
+    def select_sheets(self, sheets, sheet_name):
+        """
+        选择需要加载的Sheet, 空Sheet和表头不含"焊口编号"的Sheet(如填写说明)不加载:
+        名称包含sheet_name的所有Sheet; 都没有时取其它所有Sheet; 仍没有则取第一个非空Sheet
+        返回 [(Sheet名, 原始数据, 表头行号), ...]
+        """
+        selected = []
+        fallback = []
+        for name, raw in sheets.items():
+            if raw.empty:
+                continue
+            header_row = self.find_header_row(raw)
+            if not self.has_weld_header(raw, header_row):
+                continue
+            if sheet_name in str(name):
+                selected.append((name, raw, header_row))
+            else:
+                fallback.append((name, raw, header_row))
+
+        if selected:
+            return selected
+        if fallback:
+            return fallback
+        for name, raw in sheets.items():
+            if not raw.empty:
+                return [(name, raw, self.find_header_row(raw))]
+        raise ValueError("文件中没有包含数据的Sheet")
+
     def load_excel_data(self, file_path, sheet_name='施工检测缺欠信息表'):
-        """加载Excel数据"""
+        """
+        加载Excel数据, 工作簿只解析一次
+        读取所有匹配的Sheet并合并, 每条记录用_sheet、_segment列标记来源Sheet和线路段
+        """
         print(f"正在加载文件: {file_path}")
 
         if file_path.endswith('.csv'):
-            df = pd.read_csv(file_path, header=None)
-        else:
-            try:
-                df = pd.read_excel(file_path, sheet_name=sheet_name, header=None)
-            except:
-                df = pd.read_excel(file_path, header=None)
-
-        # 查找表头行
-        header_row = self.find_header_row(df)
-
-        # 重新读取，指定表头行
-        if file_path.endswith('.csv'):
-            df = pd.read_csv(file_path, header=header_row)
+            # CSV不带表头读取时各列都按文本解析, 切分后无法还原数值类型, 按表头行重新读取(开销很小)
+            raw = pd.read_csv(file_path, header=None)
+            selected = [('', pd.read_csv(file_path, header=self.find_header_row(raw)))]
         else:
-            try:
-                df = pd.read_excel(file_path, sheet_name=sheet_name, header=header_row)
-            except:
-                df = pd.read_excel(file_path, header=header_row)
-
-        # 标准化列名
-        df = self.normalize_column_names(df)
+            sheets = pd.read_excel(file_path, sheet_name=None, header=None)
+            # 按表头行切分, 不再重新读取文件
+            selected = [(name, self.slice_header(raw, header_row))
+                        for name, raw, header_row in self.select_sheets(sheets, sheet_name)]
+
+        frames = []
+        for name, df in selected:
+            # 标准化列名
+            df = self.normalize_column_names(df)
+            df['_sheet'] = name
+            df['_segment'] = self.segment_from_sheet(file_path, name, sheet_name)
+            frames.append(df)
+            if len(selected) > 1:
+                print(f"  Sheet {name}: {len(df)} 条记录")
+
+        df = pd.concat(frames, ignore_index=True, sort=False) if len(frames) > 1 else frames[0]
 
         print(f"成功加载 {len(df)} 条记录")
         return df
@@ -94,21 +182,25 @@ class ExcelComparer:
         # 有共同关键字则匹配成功
         return len(set(type1_keywords) & set(type2_keywords)) > 0
 
-    def compare_data(self):
-        """对比两个数据表（优化版）"""
-        print("\n开始对比数据...")
-
-        self.match_results = []
-        manual_matched = set()
-        intelligent_matched = set()
+    def build_manual_index(self):
+        """
+        建立人工数据索引, 返回 (manual_index, manual_unseen_index)
+        manual_index: (焊口编号, 关键字) -> [(m_idx, m_row), ...]
+        manual_unseen_index: 焊口编号 -> 缺欠性质包含"未见"的 [m_idx, ...]
+        manual_data未重新赋值、未调用invalidate_manual_index且关键字未变化时直接返回缓存
+        """
+        cache_key = tuple(self.defect_keywords)
+        if self._manual_index is not None and self._manual_index_key == cache_key:
+            return self._manual_index
 
-        # 预处理：按焊口编号和缺欠类型关键字建立索引
         print("正在建立索引...")
         manual_index = {}
+        manual_unseen_index = {}
         for m_idx, m_row in self.manual_data.iterrows():
             weld_id = str(m_row['焊口编号'])
+            defect_type = str(m_row['缺欠性质'])
             # 提取缺欠类型的关键字
-            defect_keywords = [kw for kw in self.defect_keywords if kw in str(m_row['缺欠性质'])]
+            defect_keywords = [kw for kw in self.defect_keywords if kw in defect_type]
 
             for kw in defect_keywords:
                 key = (weld_id, kw)
@@ -116,6 +208,67 @@ class ExcelComparer:
                     manual_index[key] = []
                 manual_index[key].append((m_idx, m_row))
 
+            if "未见" in defect_type:
+                manual_unseen_index.setdefault(weld_id, []).append(m_idx)
+
+        self._manual_index = (manual_index, manual_unseen_index)
+        self._manual_index_key = cache_key
+        return self._manual_index
+
+    def tag_segments(self):
+        """
+        统一智能记录的线路段: 以人工表中同一焊口的线路段为准;
+        人工表没有的焊口, 人工表只有一个线路段时归入该段;
+        否则智能表本身分了多个线路段时沿用自身的标记, 不分段时记为"未归属"
+        """
+        if '_segment' not in self.manual_data.columns or '_segment' not in self.intelligent_data.columns:
+            return
+        weld_segment = {}
+        for weld_id, segment in zip(self.manual_data['焊口编号'].astype(str), self.manual_data['_segment']):
+            weld_segment.setdefault(weld_id, segment)
+        manual_segments = self.manual_data['_segment'].unique()
+        default = manual_segments[0] if len(manual_segments) == 1 else None
+        own_segmented = self.intelligent_data['_segment'].nunique() > 1
+
+        self.intelligent_data['_segment'] = [
+            weld_segment.get(weld_id) or default or (own if own_segmented else '未归属')
+            for weld_id, own in zip(self.intelligent_data['焊口编号'].astype(str), self.intelligent_data['_segment'])
+        ]
+
+    def segments(self):
+        """所有线路段, 人工表中的顺序在前"""
+        segments = []
+        for df in (self.manual_data, self.intelligent_data):
+            if '_segment' not in df.columns:
+                continue
+            for segment in df['_segment'].unique():
+                if segment not in segments:
+                    segments.append(segment)
+        return segments
+
+    def weld_segments(self):
+        """焊口编号 -> 线路段"""
+        weld_segment = {}
+        for df in (self.manual_data, self.intelligent_data):
+            if '_segment' not in df.columns:
+                continue
+            for weld_id, segment in zip(df['焊口编号'].astype(str), df['_segment']):
+                weld_segment.setdefault(weld_id, segment)
+        return weld_segment
+
+    def compare_data(self):
+        """对比两个数据表（优化版）, 多个线路段的记录共用同一个索引一次完成匹配"""
+        print("\n开始对比数据...")
+
+        self.tag_segments()
+
+        self.match_results = []
+        manual_matched = set()
+        intelligent_matched = set()
+
+        # 预处理：按焊口编号和缺欠类型关键字建立索引(人工数据不变时复用)
+        manual_index, manual_unseen_index = self.build_manual_index()
+
         print(f"索引建立完成，开始匹配...")
         processed = 0
 
@@ -132,13 +285,10 @@ class ExcelComparer:
             #  特殊逻辑：人工记录包含 “未见”
             #    同焊口编号 → 自动匹配成功
             # ============================================================
-            manual_same_weld = self.manual_data[self.manual_data['焊口编号'].astype(str) == weld_id]
-            manual_unseen = manual_same_weld[
-                manual_same_weld['缺欠性质'].astype(str).str.contains("未见")
-            ]
+            manual_unseen = manual_unseen_index.get(weld_id, [])
 
             if len(manual_unseen) > 0:
-                for m_idx in manual_unseen.index:
+                for m_idx in manual_unseen:
                     # 每个人工记录只匹配一次
                     if m_idx not in manual_matched:
                         manual_matched.add(m_idx)
@@ -164,12 +314,12 @@ class ExcelComparer:
                     continue
 
                 for m_idx, m_row in manual_index[key]:
-                    # 检查起始位置误差（±20mm）
+                    # 检查起始位置误差（默认±20mm）
                     try:
                         i_pos = self.extract_start_position(i_row['缺欠起始位置（mm）'])
                         m_pos = self.extract_start_position(m_row['缺欠起始位置（mm）'])
 
-                        if i_pos is not None and m_pos is not None and abs(i_pos - m_pos) <= 20:
+                        if i_pos is not None and m_pos is not None and abs(i_pos - m_pos) <= self.position_tolerance:
                             matched = True
                             manual_matched.add(m_idx)
                             intelligent_matched.add(i_idx)
@@ -206,10 +356,11 @@ class ExcelComparer:
         print(f"  智能评判记录: {len(self.intelligent_data)} 条")
         print(f"  成功匹配: {len(intelligent_matched)} 对")
 
-    def generate_output_file(self, output_path):
-        """生成带颜色标记的输出文件"""
-        print(f"\n正在生成输出文件: {output_path}")
-
+    def build_output_rows(self):
+        """
+        生成输出记录(已排序)
+        返回: (df_output, color_info), color_info[i]对应df_output第i行的颜色
+        """
         new_data = []
         added_manual_indices = set()
 
@@ -334,13 +485,24 @@ class ExcelComparer:
 
         # 删除辅助列
         df_output = df_new.drop(columns=['_color', '_sort_key']).copy()
-
-        # 保存到Excel
-        df_output.to_excel(output_path, index=False)
-
-        # 使用openpyxl添加颜色
-        wb = load_workbook(output_path)
-        ws = wb.active
+        return df_output, color_info
+
+    def sheet_title(self, name):
+        """Excel的Sheet名不能含[]:*?/\\且不超过31个字符"""
+        return re.sub(r'[\[\]:*?/\\]', '_', str(name))[:31]
+
+    def write_rows_sheet(self, ws, df_output, color_info):
+        """把输出记录写入Sheet并按color_info填色"""
+        # 表头样式与pandas.to_excel保持一致
+        header_font = Font(bold=True)
+        thin = Side(style='thin')
+        header_border = Border(left=thin, right=thin, top=thin, bottom=thin)
+        header_alignment = Alignment(horizontal='center', vertical='top')
+        ws.append(list(df_output.columns))
+        for cell in ws[1]:
+            cell.font = header_font
+            cell.border = header_border
+            cell.alignment = header_alignment
 
         fills = {
             'light_green': PatternFill(start_color='90EE90', end_color='90EE90', fill_type='solid'),
@@ -349,75 +511,189 @@ class ExcelComparer:
             'yellow': PatternFill(start_color='FFFF00', end_color='FFFF00', fill_type='solid')
         }
 
-        for idx, color in enumerate(color_info, start=2):
+        for idx, (values, color) in enumerate(zip(df_output.itertuples(index=False), color_info), start=2):
+            ws.append([v if v != '' else None for v in values])
             if color in fills:
                 for col in range(1, 9):
                     ws.cell(row=idx, column=col).fill = fills[color]
 
-        wb.save(output_path)
-        self.add_statistics_to_excel(output_path)
+    def build_output_workbook(self, df_output, color_info):
+        """
+        在内存中生成带颜色标记和统计报告的工作簿(不落盘)
+        有多个线路段时, 在总表和总统计之后为每个线路段追加记录Sheet和统计Sheet
+        """
+        wb = Workbook()
+        ws = wb.active
+        ws.title = 'Sheet1'
+        self.write_rows_sheet(ws, df_output, color_info)
+        self.write_statistics_sheet(wb)
+
+        segments = self.segments()
+        if len(segments) > 1:
+            weld_segment = self.weld_segments()
+            row_segments = [weld_segment.get(weld_id) for weld_id in df_output['焊口编号']]
+            for segment in segments:
+                mask = [s == segment for s in row_segments]
+                ws_segment = wb.create_sheet(self.sheet_title(segment))
+                self.write_rows_sheet(ws_segment, df_output[mask],
+                                      [color for color, m in zip(color_info, mask) if m])
+                self.write_statistics_sheet(wb, self.compute_statistics(segment),
+                                            title=self.sheet_title(f'{segment}统计'), index=len(wb.sheetnames))
+        return wb
+
+    def generate_output_file(self, output_path, shard_rows=None, shard_by='weld', shard_workers=None):
+        """
+        生成带颜色标记的输出文件
+        shard_rows不为None且记录数超过该值时分片输出, output_path写为分片索引工作簿
+        """
+        print(f"\n正在生成输出文件: {output_path}")
+
+        df_output, color_info = self.build_output_rows()
+        if shard_rows and len(df_output) > shard_rows:
+            shards = self.write_sharded_output(output_path, df_output, color_info, shard_rows, shard_by, shard_workers)
+            print(f"  记录数超过 {shard_rows} 条, 已分为 {len(shards)} 个分片")
+        else:
+            wb = self.build_output_workbook(df_output, color_info)
+            wb.save(output_path)
 
         print(f"输出文件生成成功！")
         print(f"  总记录数: {len(df_output)} 条")
         print(f"  (人工 {len(self.manual_data)} + 智能 {len(self.intelligent_data)})")
 
+    def plan_shards(self, df_output, max_rows, by='weld'):
+        """
+        划分输出分片, 同一焊口的记录不跨分片(单个焊口超过max_rows时独占一个分片)
+        by='weld': 按排序后的焊口编号范围依次切分, 每片不超过max_rows行
+        by='segment': 每个线路段单独切分, 同一分片只含一个线路段
+        返回 [{'segment': 线路段或None, 'rows': [行号, ...], 'welds': [焊口编号, ...]}, ...]
+        """
+        weld_segment = self.weld_segments() if by == 'segment' else {}
+        shards = []
+        current = {}
+        weld_ids = df_output['焊口编号'].tolist()
+        start = 0
+        # 输出记录已按焊口编号排序, 同一焊口的记录连续
+        for stop in range(1, len(weld_ids) + 1):
+            if stop < len(weld_ids) and weld_ids[stop] == weld_ids[start]:
+                continue
+            weld_id = weld_ids[start]
+            key = weld_segment.get(weld_id)
+            shard = current.get(key)
+            if shard is None or (shard['rows'] and len(shard['rows']) + stop - start > max_rows):
+                shard = {'segment': key, 'rows': [], 'welds': []}
+                shards.append(shard)
+                current[key] = shard
+            shard['rows'].extend(range(start, stop))
+            shard['welds'].append(weld_id)
+            start = stop
+        return shards
+
+    def write_sharded_output(self, output_path, df_output, color_info, max_rows, by='weld', workers=None):
+        """
+        分片输出: 记录按焊口编号范围(或线路段)写入多个工作簿 <文件名>_分片001.xlsx ...,
+        各分片在子进程中并行写出; output_path写为索引工作簿,
+        列出每个分片的焊口范围、记录数和统计, 以及焊口所在分片清单和总统计
+        """
+        shards = self.plan_shards(df_output, max_rows, by)
+        base = os.path.splitext(output_path)[0]
+
+        tasks = []
+        for i, shard in enumerate(shards, start=1):
+            shard['path'] = f"{base}_分片{i:03d}.xlsx"
+            shard['stats'] = self.compute_statistics(welds=set(shard['welds']))
+            shard['colors'] = [color_info[r] for r in shard['rows']]
+            tasks.append((shard['path'], df_output.iloc[shard['rows']], shard['colors'], shard['stats']))
+
+        if workers == 1 or len(tasks) == 1:
+            for task in tasks:
+                write_shard(*task)
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                futures = [pool.submit(write_shard, *task) for task in tasks]
+                for future in futures:
+                    future.result()
+
+        self.write_shard_index(output_path, shards)
+        return shards
+
+    def write_shard_index(self, output_path, shards):
+        """写出分片索引工作簿: 分片索引、焊口清单、总统计报告"""
+        wb = Workbook()
+        ws = wb.active
+        ws.title = '分片索引'
+        ws.append(['分片', '文件', '线路段', '起始焊口', '结束焊口', '焊口数', '记录数', '标红记录数',
+                   '标黄记录数', '匹配焊口数', '人工关键字记录数', '人工关键字匹配数'])
+        for cell in ws[1]:
+            cell.font = Font(bold=True)
+        for i, shard in enumerate(shards, start=1):
+            stats = shard['stats']
+            ws.append([i, os.path.basename(shard['path']), shard['segment'] or '',
+                       shard['welds'][0], shard['welds'][-1], len(shard['welds']), len(shard['rows']),
+                       shard['colors'].count('red'), stats['yellow_records'],
+                       len(stats['matched_intelligent_welds']), stats['manual_keyword_count'],
+                       stats['manual_matched_keyword_count']])
+        ws.column_dimensions['B'].width = 40
+        for col in 'DE':
+            ws.column_dimensions[col].width = 20
+
+        ws_welds = wb.create_sheet('焊口清单')
+        ws_welds.append(['焊口编号', '线路段', '分片', '文件'])
+        for cell in ws_welds[1]:
+            cell.font = Font(bold=True)
+        for i, shard in enumerate(shards, start=1):
+            file_name = os.path.basename(shard['path'])
+            for weld_id in shard['welds']:
+                ws_welds.append([weld_id, shard['segment'] or '', i, file_name])
+        ws_welds.column_dimensions['A'].width = 20
+        ws_welds.column_dimensions['D'].width = 40
+
+        self.write_statistics_sheet(wb, index=len(wb.sheetnames))
+        wb.save(output_path)
+
     def contains_defect_keyword(self, defect_type):
         """检查缺欠类型是否包含关键字"""
         defect_str = str(defect_type)
         return any(kw in defect_str for kw in self.defect_keywords)
 
-    def generate_statistics_report(self):
-        """生成统计报告并打印到控制台"""
-        print("\n" + "=" * 100)
-        print("                        详细记录统计")
-        print("=" * 100 + "\n")
+    def compute_statistics(self, segment=None, welds=None):
+        """
+        计算统计数据(控制台报告和统计报告Sheet共用)
+        segment不为None时只统计该线路段的记录, welds不为None时只统计这些焊口的记录
+        """
+        manual_data = self.manual_data
+        intelligent_data = self.intelligent_data
+        if segment is not None:
+            manual_data = manual_data[manual_data['_segment'] == segment]
+            intelligent_data = intelligent_data[intelligent_data['_segment'] == segment]
+        if welds is not None:
+            manual_data = manual_data[manual_data['焊口编号'].astype(str).isin(welds)]
+            intelligent_data = intelligent_data[intelligent_data['焊口编号'].astype(str).isin(welds)]
+        manual_in = set(manual_data.index)
+        intelligent_in = set(intelligent_data.index)
+
+        intelligent_welds = set(intelligent_data['焊口编号'].astype(str).unique())
+        manual_welds = set(manual_data['焊口编号'].astype(str).unique())
 
-        # 【一、焊口数量统计】
-        print("【一、焊口数量统计】")
-        intelligent_welds = set(self.intelligent_data['焊口编号'].astype(str).unique())
-        manual_welds = set(self.manual_data['焊口编号'].astype(str).unique())
-
-        common_welds = intelligent_welds & manual_welds
-        intelligent_only = intelligent_welds - manual_welds
-        manual_only = manual_welds - intelligent_welds
-
-        print(f"  • 智能表焊口总数: {len(intelligent_welds)}")
-        print(f"  • 人工表焊口总数: {len(manual_welds)}")
-        print(f"  • 智能表独有的焊口数量: {len(intelligent_only)}")
-        print(f"  • 人工表独有的焊口数量: {len(manual_only)}")
-        print(f"  • 二者同时拥有的焊口数量: {len(common_welds)}\n")
-
-        # 【二、匹配情况统计】
-        print("【二、匹配情况统计】")
         matched_intelligent_welds = set()
-        for result in self.match_results:
-            if result['matched'] and result['intelligent_idx'] is not None:
-                i_row = self.intelligent_data.iloc[result['intelligent_idx']]
-                matched_intelligent_welds.add(i_row['焊口编号'])
-
-        print(f"  • 智能评判结果表中满足人工评判标准表的焊口数量: {len(matched_intelligent_welds)}\n")
-
-        # 【三、标黄记录统计】
-        print("【三、标黄记录统计(智能表中未匹配的Ⅲ、Ⅳ级缺陷)】")
         yellow_welds = set()
         yellow_records = 0
         for result in self.match_results:
-            if not result['matched'] and result['intelligent_idx'] is not None:
-                i_row = self.intelligent_data.iloc[result['intelligent_idx']]
+            if result['intelligent_idx'] not in intelligent_in:
+                continue
+            i_row = self.intelligent_data.iloc[result['intelligent_idx']]
+            if result['matched']:
+                matched_intelligent_welds.add(i_row['焊口编号'])
+            else:
                 level = str(i_row.get('评定等级', ''))
                 if level in ['Ⅲ', 'Ⅳ', 'III', 'IV']:
                     yellow_welds.add(i_row['焊口编号'])
                     yellow_records += 1
 
-        print(f"  • 智能评判结果表中标黄的焊口数量: {len(yellow_welds)}")
-        print(f"  • 智能评判结果表中标黄的记录总数: {yellow_records}\n")
-
-        # 【四、人工表关键字记录统计】
-        print("【四、人工表关键字记录统计】")
+        # 第④条统计
         manual_keyword_count = 0
         manual_keyword_details = {kw: 0 for kw in self.defect_keywords}
 
-        for _, row in self.manual_data.iterrows():
+        for _, row in manual_data.iterrows():
             if str(row['焊口编号']) in intelligent_welds:
                 defect_type = str(row['缺欠性质'])
                 for kw in self.defect_keywords:
@@ -426,19 +702,13 @@ class ExcelComparer:
                         manual_keyword_details[kw] += 1
                         break
 
-        detail_str = '、'.join([f"{kw}-{count}" for kw, count in manual_keyword_details.items() if count > 0])
-        print(
-            f"  • 人工评判标准表中包含关键字(圆、条、未熔合、未焊透、裂纹、内凹、咬边、烧穿、未见)且焊口编号在智能表中出现过的记录总数: {manual_keyword_count}")
-        print(f"    其中包括: {detail_str}\n")
-
-        # 【五、人工表关键字匹配成功统计】
-        print("【五、人工表关键字匹配成功统计】")
+        # 第⑤条统计
         manual_matched_keyword_count = 0
         manual_matched_keyword_details = {kw: 0 for kw in self.defect_keywords}
         counted_manual_indices = set()
 
         for result in self.match_results:
-            if result['matched'] and result['manual_idx'] is not None:
+            if result['matched'] and result['manual_idx'] in manual_in:
                 if result['manual_idx'] in counted_manual_indices:
                     continue
 
@@ -451,78 +721,73 @@ class ExcelComparer:
                         counted_manual_indices.add(result['manual_idx'])
                         break
 
-        detail_str = '、'.join([f"{kw}-{count}" for kw, count in manual_matched_keyword_details.items() if count > 0])
-        print(
-            f"  • 人工评判标准表中包含关键字(圆、条、未熔合、未焊透、裂纹、内凹、咬边、烧穿、未见)且成功与智能评判表匹配的记录总数: {manual_matched_keyword_count}")
-        print(f"    其中包括: {detail_str}\n")
-
-        print("=" * 100)
-
-    def add_statistics_to_excel(self, output_path):
-        """将统计报告添加到Excel的Sheet2"""
-        wb = load_workbook(output_path)
+        return {
+            'intelligent_welds': intelligent_welds,
+            'manual_welds': manual_welds,
+            'common_welds': intelligent_welds & manual_welds,
+            'intelligent_only': intelligent_welds - manual_welds,
+            'manual_only': manual_welds - intelligent_welds,
+            'matched_intelligent_welds': matched_intelligent_welds,
+            'yellow_welds': yellow_welds,
+            'yellow_records': yellow_records,
+            'manual_keyword_count': manual_keyword_count,
+            'manual_keyword_details': manual_keyword_details,
+            'manual_matched_keyword_count': manual_matched_keyword_count,
+            'manual_matched_keyword_details': manual_matched_keyword_details,
+        }
 
-        # 创建新的Sheet2
-        if 'Sheet2' in wb.sheetnames:
-            ws_stats = wb['Sheet2']
-            wb.remove(ws_stats)
-        ws_stats = wb.create_sheet('统计报告', 1)
+    def generate_statistics_report(self, stats=None):
+        """生成统计报告并打印到控制台"""
+        if stats is None:
+            stats = self.compute_statistics()
 
-        # 生成统计数据
-        intelligent_welds = set(self.intelligent_data['焊口编号'].astype(str).unique())
-        manual_welds = set(self.manual_data['焊口编号'].astype(str).unique())
+        print("\n" + "=" * 100)
+        print("                        详细记录统计")
+        print("=" * 100 + "\n")
 
-        common_welds = intelligent_welds & manual_welds
-        intelligent_only = intelligent_welds - manual_welds
-        manual_only = manual_welds - intelligent_welds
+        # 【一、焊口数量统计】
+        print("【一、焊口数量统计】")
+        print(f"  • 智能表焊口总数: {len(stats['intelligent_welds'])}")
+        print(f"  • 人工表焊口总数: {len(stats['manual_welds'])}")
+        print(f"  • 智能表独有的焊口数量: {len(stats['intelligent_only'])}")
+        print(f"  • 人工表独有的焊口数量: {len(stats['manual_only'])}")
+        print(f"  • 二者同时拥有的焊口数量: {len(stats['common_welds'])}\n")
 
-        matched_intelligent_welds = set()
-        for result in self.match_results:
-            if result['matched'] and result['intelligent_idx'] is not None:
-                i_row = self.intelligent_data.iloc[result['intelligent_idx']]
-                matched_intelligent_welds.add(i_row['焊口编号'])
+        # 【二、匹配情况统计】
+        print("【二、匹配情况统计】")
+        print(f"  • 智能评判结果表中满足人工评判标准表的焊口数量: {len(stats['matched_intelligent_welds'])}\n")
 
-        yellow_welds = set()
-        yellow_records = 0
-        for result in self.match_results:
-            if not result['matched'] and result['intelligent_idx'] is not None:
-                i_row = self.intelligent_data.iloc[result['intelligent_idx']]
-                level = str(i_row.get('评定等级', ''))
-                if level in ['Ⅲ', 'Ⅳ', 'III', 'IV']:
-                    yellow_welds.add(i_row['焊口编号'])
-                    yellow_records += 1
+        # 【三、标黄记录统计】
+        print("【三、标黄记录统计(智能表中未匹配的Ⅲ、Ⅳ级缺陷)】")
+        print(f"  • 智能评判结果表中标黄的焊口数量: {len(stats['yellow_welds'])}")
+        print(f"  • 智能评判结果表中标黄的记录总数: {stats['yellow_records']}\n")
 
-        # 第④条统计
-        manual_keyword_count = 0
-        manual_keyword_details = {kw: 0 for kw in self.defect_keywords}
+        # 【四、人工表关键字记录统计】
+        print("【四、人工表关键字记录统计】")
+        detail_str = '、'.join([f"{kw}-{count}" for kw, count in stats['manual_keyword_details'].items() if count > 0])
+        print(
+            f"  • 人工评判标准表中包含关键字(圆、条、未熔合、未焊透、裂纹、内凹、咬边、烧穿、未见)且焊口编号在智能表中出现过的记录总数: {stats['manual_keyword_count']}")
+        print(f"    其中包括: {detail_str}\n")
 
-        for _, row in self.manual_data.iterrows():
-            if str(row['焊口编号']) in intelligent_welds:
-                defect_type = str(row['缺欠性质'])
-                for kw in self.defect_keywords:
-                    if kw in defect_type:
-                        manual_keyword_count += 1
-                        manual_keyword_details[kw] += 1
-                        break
+        # 【五、人工表关键字匹配成功统计】
+        print("【五、人工表关键字匹配成功统计】")
+        detail_str = '、'.join([f"{kw}-{count}" for kw, count in stats['manual_matched_keyword_details'].items() if count > 0])
+        print(
+            f"  • 人工评判标准表中包含关键字(圆、条、未熔合、未焊透、裂纹、内凹、咬边、烧穿、未见)且成功与智能评判表匹配的记录总数: {stats['manual_matched_keyword_count']}")
+        print(f"    其中包括: {detail_str}\n")
 
-        # 第⑤条统计
-        manual_matched_keyword_count = 0
-        manual_matched_keyword_details = {kw: 0 for kw in self.defect_keywords}
-        counted_manual_indices = set()
+        print("=" * 100)
 
-        for result in self.match_results:
-            if result['matched'] and result['manual_idx'] is not None:
-                if result['manual_idx'] in counted_manual_indices:
-                    continue
+    def write_statistics_sheet(self, wb, stats=None, title='统计报告', index=1):
+        """将统计报告写入工作簿中的统计Sheet(不保存)"""
+        if stats is None:
+            stats = self.compute_statistics()
 
-                m_row = self.manual_data.iloc[result['manual_idx']]
-                defect_type = str(m_row['缺欠性质'])
-                for kw in self.defect_keywords:
-                    if kw in defect_type:
-                        manual_matched_keyword_count += 1
-                        manual_matched_keyword_details[kw] += 1
-                        counted_manual_indices.add(result['manual_idx'])
-                        break
+        # 创建新的Sheet2
+        if 'Sheet2' in wb.sheetnames:
+            ws_stats = wb['Sheet2']
+            wb.remove(ws_stats)
+        ws_stats = wb.create_sheet(title, index)
 
         # 写入Sheet2
         row = 1
@@ -534,37 +799,37 @@ class ExcelComparer:
         ws_stats.cell(row, 1).font = Font(bold=True)
         row += 1
 
-        ws_stats.cell(row, 1, f"• 智能表焊口总数: {len(intelligent_welds)}")
+        ws_stats.cell(row, 1, f"• 智能表焊口总数: {len(stats['intelligent_welds'])}")
         row += 1
-        ws_stats.cell(row, 1, f"• 人工表焊口总数: {len(manual_welds)}")
+        ws_stats.cell(row, 1, f"• 人工表焊口总数: {len(stats['manual_welds'])}")
         row += 1
-        ws_stats.cell(row, 1, f"• 智能表独有的焊口数量: {len(intelligent_only)}")
+        ws_stats.cell(row, 1, f"• 智能表独有的焊口数量: {len(stats['intelligent_only'])}")
         row += 1
-        ws_stats.cell(row, 1, f"• 人工表独有的焊口数量: {len(manual_only)}")
+        ws_stats.cell(row, 1, f"• 人工表独有的焊口数量: {len(stats['manual_only'])}")
         row += 1
-        ws_stats.cell(row, 1, f"• 二者同时拥有的焊口数量: {len(common_welds)}")
+        ws_stats.cell(row, 1, f"• 二者同时拥有的焊口数量: {len(stats['common_welds'])}")
         row += 2
 
         ws_stats.cell(row, 1, "【二、匹配情况统计】")
         ws_stats.cell(row, 1).font = Font(bold=True)
         row += 1
-        ws_stats.cell(row, 1, f"• 智能评判结果表中满足人工评判标准表的焊口数量: {len(matched_intelligent_welds)}")
+        ws_stats.cell(row, 1, f"• 智能评判结果表中满足人工评判标准表的焊口数量: {len(stats['matched_intelligent_welds'])}")
         row += 2
 
         ws_stats.cell(row, 1, "【三、标黄记录统计(智能表中未匹配的Ⅲ、Ⅳ级缺陷)】")
         ws_stats.cell(row, 1).font = Font(bold=True)
         row += 1
-        ws_stats.cell(row, 1, f"• 智能评判结果表中标黄的焊口数量: {len(yellow_welds)}")
+        ws_stats.cell(row, 1, f"• 智能评判结果表中标黄的焊口数量: {len(stats['yellow_welds'])}")
         row += 1
-        ws_stats.cell(row, 1, f"• 智能评判结果表中标黄的记录总数: {yellow_records}")
+        ws_stats.cell(row, 1, f"• 智能评判结果表中标黄的记录总数: {stats['yellow_records']}")
         row += 2
 
         ws_stats.cell(row, 1, "【四、人工表关键字记录统计】")
         ws_stats.cell(row, 1).font = Font(bold=True)
         row += 1
-        detail_str1 = '、'.join([f"{kw}-{count}" for kw, count in manual_keyword_details.items() if count > 0])
+        detail_str1 = '、'.join([f"{kw}-{count}" for kw, count in stats['manual_keyword_details'].items() if count > 0])
         ws_stats.cell(row, 1,
-                      f"• 人工评判标准表中包含关键字且焊口编号在智能表中出现过的记录总数: {manual_keyword_count}")
+                      f"• 人工评判标准表中包含关键字且焊口编号在智能表中出现过的记录总数: {stats['manual_keyword_count']}")
         row += 1
         ws_stats.cell(row, 1, f"  其中包括: {detail_str1}")
         row += 2
@@ -572,19 +837,40 @@ class ExcelComparer:
         ws_stats.cell(row, 1, "【五、人工表关键字匹配成功统计】")
         ws_stats.cell(row, 1).font = Font(bold=True)
         row += 1
-        detail_str2 = '、'.join([f"{kw}-{count}" for kw, count in manual_matched_keyword_details.items() if count > 0])
+        detail_str2 = '、'.join([f"{kw}-{count}" for kw, count in stats['manual_matched_keyword_details'].items() if count > 0])
         ws_stats.cell(row, 1,
-                      f"• 人工评判标准表中包含关键字且成功与智能评判表匹配的记录总数: {manual_matched_keyword_count}")
+                      f"• 人工评判标准表中包含关键字且成功与智能评判表匹配的记录总数: {stats['manual_matched_keyword_count']}")
         row += 1
         ws_stats.cell(row, 1, f"  其中包括: {detail_str2}")
 
         # 调整列宽
         ws_stats.column_dimensions['A'].width = 120
+        return ws_stats
 
+    def add_statistics_to_excel(self, output_path):
+        """将统计报告添加到已有Excel文件的Sheet2"""
+        wb = load_workbook(output_path)
+        self.write_statistics_sheet(wb)
         wb.save(output_path)
 
-    def run(self, manual_path, intelligent_path, output_path):
-        """执行完整的对比流程"""
+    def save_to_store(self, store_path, manual_path, intelligent_path, output_path=None):
+        """把本次对比的记录、匹配对和统计快照保存到SQLite结果库, 返回run_id"""
+        from resultstore import ResultStore
+
+        store = ResultStore(store_path)
+        try:
+            run_id = store.save_run(self, manual_path, intelligent_path, output_path)
+        finally:
+            store.close()
+        print(f"对比结果已保存到结果库: {store_path} (run_id={run_id})")
+        return run_id
+
+    def run(self, manual_path, intelligent_path, output_path, store_path=None, shard_rows=None, shard_by='weld',
+            shard_workers=None):
+        """
+        执行完整的对比流程, store_path不为None时同时保存到结果库
+        shard_rows/shard_by/shard_workers为分片输出参数, 见generate_output_file
+        """
         try:
             # 1. 加载数据
             self.manual_data = self.load_excel_data(manual_path)
@@ -594,11 +880,15 @@ class ExcelComparer:
             self.compare_data()
 
             # 3. 生成输出文件
-            self.generate_output_file(output_path)
+            self.generate_output_file(output_path, shard_rows, shard_by, shard_workers)
 
             # 4. 生成统计报告
             self.generate_statistics_report()
 
+            # 5. 保存到结果库
+            if store_path:
+                self.save_to_store(store_path, manual_path, intelligent_path, output_path)
+
             print("\n所有任务完成！")
             return True
 
@@ -608,6 +898,17 @@ class ExcelComparer:
             traceback.print_exc()
             return False
 
+def write_shard(path, df_output, color_info, stats):
+    """写出一个分片工作簿(记录Sheet + 统计Sheet); 模块级函数, 供子进程调用"""
+    comparer = ExcelComparer()
+    wb = Workbook()
+    ws = wb.active
+    ws.title = 'Sheet1'
+    comparer.write_rows_sheet(ws, df_output, color_info)
+    comparer.write_statistics_sheet(wb, stats)
+    wb.save(path)
+    return path
+
 def main():
     """主函数"""
     print("=" * 100)
@@ -618,7 +919,11 @@ def main():
     success = comparer.run(
         MANUAL_FILE_PATH,
         INTELLIGENT_FILE_PATH,
-        OUTPUT_FILE_PATH
+        OUTPUT_FILE_PATH,
+        RESULT_DB_PATH,
+        SHARD_MAX_ROWS,
+        SHARD_BY,
+        SHARD_WORKERS
     )
 
     if success:
@@ -1,6 +1,13 @@
+import csv
+import hashlib
+import json
 import os
+import re
+import time
 import traceback
-from collections import defaultdict
+import zipfile
+from collections import defaultdict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
 from io import BytesIO
 from openpyxl import load_workbook
 from openpyxl.drawing.image import Image as XLImage
@@ -17,6 +24,41 @@ COL_WELD = "焊口编号"
 COL_START = "起始位置"
 COL_END = "结束位置"
 COL_SCREENSHOT = "截图"
+# 截图列宽(Excel字符宽)及对应像素宽度
+SCREENSHOT_COL_WIDTH = 16
+SCREENSHOT_WIDTH_PX = int(SCREENSHOT_COL_WIDTH * 7)
+# 高位深底片转8位时的窗口: 取裁剪区域灰度的上下百分位
+WINDOW_PERCENTILES = (0.5, 99.5)
+# 统计百分位时的抽样步长
+WINDOW_SAMPLE_STEP = 4
+# 截图JPEG质量及超出预算后可降到的最低质量
+JPEG_QUALITY = 75
+JPEG_MIN_QUALITY = 30
+# 截图最大边长(像素), None表示不限制
+MAX_IMAGE_SIDE = 600
+# 所有截图的总字节预算, None表示不限制
+IMAGE_BYTE_BUDGET = 200 * 1024 * 1024
+# 每行处理结果代码及默认原因
+OUTCOMES = {
+    'ok': '插入成功',
+    'bad_position': '起始/结束位置非数字',
+    'film_not_found': '未找到底片文件',
+    'decode_failed': '底片读取失败',
+    'recognize_failed': '识别失败',
+    'no_digits': '签字信息为空',
+    'no_sign_pair': '未能找到合适的签字对',
+    'crop_too_small': '裁剪尺寸过小',
+    'insert_error': '插入图片异常',
+    'row_error': '处理行时异常',
+}
+# 每完成多少行截图保存一次检查点
+CHECKPOINT_EVERY = 200
+# 底片文件扩展名(小写比较)
+FILM_EXTENSIONS = ('.dcm', '.diconde')
+# 是否递归扫描底片目录的子文件夹(默认只查找顶层, 避免选中存档/重拍子文件夹中的同名底片)
+FILM_RECURSIVE = False
+# 底片索引缓存文件(跨次运行复用)
+FILM_INDEX_CACHE = os.path.join(TMP_SAVE_DIR, "film_index.json")
 
 def is_row_red(ws, row_idx):
     """判断Excel行是否标红"""
@@ -34,19 +76,681 @@ def is_row_red(ws, row_idx):
                 return True
     return False
 
-def find_file_with_extension(directory, base_name):
+class FilmLocator:
     """
-    在目录中查找指定基础名称的文件,支持.dcm和.DICONDE扩展名(不区分大小写)
-    返回完整文件路径,如果未找到返回None
+    底片定位器: 用os.scandir一次性扫描一个或多个底片根目录(可递归),
+    建立 焊口编号(不区分大小写) -> 底片路径 的映射。
+    索引可保存为JSON在多次运行间复用, refresh()只对mtime变化的目录重新扫描。
     """
-    possible_extensions = ['.dcm', '.DCM', '.diconde', '.DICONDE', '.Diconde']
 
-    for ext in possible_extensions:
-        file_path = os.path.join(directory, base_name + ext)
-        if os.path.exists(file_path):
-            return file_path
+    def __init__(self, roots, recursive=False):
+        if isinstance(roots, str):
+            roots = [roots]
+        self.roots = [os.path.abspath(r) for r in roots]
+        self.recursive = recursive
+        # 目录 -> {'mtime': 目录mtime, 'files': {焊口编号小写: 路径}}, 按扫描顺序(先浅后深)
+        self.dirs = {}
+        self.index = {}
 
-    return None
+    def _scan_dir(self, directory):
+        """扫描单个目录(不递归), 返回子目录列表"""
+        files = {}
+        subdirs = []
+        try:
+            mtime = os.stat(directory).st_mtime
+            with os.scandir(directory) as it:
+                entries = sorted(it, key=lambda e: e.name)
+        except OSError:
+            self.dirs.pop(directory, None)
+            return subdirs
+
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.path)
+                    continue
+            except OSError:
+                continue
+            base, ext = os.path.splitext(entry.name)
+            if ext.lower() in FILM_EXTENSIONS:
+                files.setdefault(base.strip().lower(), entry.path)
+
+        self.dirs[directory] = {'mtime': mtime, 'files': files}
+        return subdirs
+
+    def _walk(self, directories):
+        """从给定目录开始广度优先扫描, 已登记的子目录不重复扫描"""
+        queue = list(directories)
+        while queue:
+            subdirs = self._scan_dir(queue.pop(0))
+            if self.recursive:
+                queue.extend(d for d in subdirs if d not in self.dirs)
+
+    def _rebuild_index(self):
+        """合并各目录的映射, 同名时浅层/先扫描的目录优先"""
+        index = {}
+        for info in self.dirs.values():
+            for key, path in info['files'].items():
+                index.setdefault(key, path)
+        self.index = index
+
+    def scan(self):
+        """完整扫描所有根目录"""
+        self.dirs = {}
+        self._walk(self.roots)
+        self._rebuild_index()
+        return len(self.index)
+
+    def refresh(self):
+        """
+        按目录mtime增量刷新: 每个目录只stat一次, 仅重新扫描有文件增删的目录
+        返回重新扫描的目录数
+        """
+        changed = []
+        for directory, info in list(self.dirs.items()):
+            try:
+                mtime = os.stat(directory).st_mtime
+            except OSError:
+                mtime = None
+            if mtime is None:
+                del self.dirs[directory]
+                changed.append(directory)
+            elif mtime != info['mtime']:
+                changed.append(directory)
+
+        # 根目录之前不存在、现在出现的情况
+        missing_roots = [r for r in self.roots if r not in self.dirs and os.path.isdir(r)]
+
+        if not changed and not missing_roots:
+            return 0
+
+        self._walk([d for d in changed if os.path.isdir(d)] + missing_roots)
+        self._rebuild_index()
+        return len(changed) + len(missing_roots)
+
+    def find(self, weld_id):
+        """按焊口编号查找底片, 未找到返回None"""
+        return self.index.get(str(weld_id).strip().lower())
+
+    def save(self, cache_path):
+        """保存索引到JSON文件"""
+        os.makedirs(os.path.dirname(os.path.abspath(cache_path)), exist_ok=True)
+        data = {'roots': self.roots, 'recursive': self.recursive, 'dirs': self.dirs}
+        tmp_path = cache_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, cache_path)
+
+    def load(self, cache_path):
+        """从JSON文件加载索引, 根目录或递归设置不一致时返回False"""
+        try:
+            with open(cache_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if data.get('roots') != self.roots or data.get('recursive') != self.recursive:
+            return False
+        self.dirs = data.get('dirs', {})
+        self._rebuild_index()
+        return True
+
+    @classmethod
+    def open(cls, roots, recursive=False, cache_path=None):
+        """加载缓存并增量刷新; 无可用缓存时完整扫描。结果写回缓存"""
+        locator = cls(roots, recursive=recursive)
+        if cache_path and locator.load(cache_path):
+            changed = locator.refresh()
+        else:
+            locator.scan()
+            changed = len(locator.dirs)
+        if cache_path and changed:
+            try:
+                locator.save(cache_path)
+            except OSError as e:
+                print(f"警告: 底片索引缓存保存失败: {e}")
+        return locator
+
+# 解码后的底片: 路径、像素矩阵、焊缝上/下边界
+FilmData = namedtuple('FilmData', ['path', 'matrix', 'seam_top', 'seam_bottom'])
+
+class RecognizerError(Exception):
+    """签字识别失败(整批或单张底片), 消息作为失败原因输出"""
+    pass
+
+class Recognizer:
+    """
+    签字识别后端接口
+    recognize_batch接收一批FilmData, 返回与之一一对应的All_Info列表:
+        [文件名, digits_info, 倍数], 单张底片失败时对应位置为RecognizerError
+    batch_size为主流程每次送入的底片数量
+    """
+    batch_size = 1
+
+    def recognize_batch(self, films):
+        raise NotImplementedError
+
+class DataThreadRecognizer(Recognizer):
+    """原有的GPU识别线程self.dataThread, 要求CUDA版本不低于min_cuda, 每次识别一张"""
+    batch_size = 1
+
+    def __init__(self, host, min_cuda=11.3):
+        self.host = host
+        self.min_cuda = min_cuda
+
+    def recognize_batch(self, films):
+        if self.host.dataThread.cuda_version_float < self.min_cuda:
+            self.host.All_Info = [0, [], 10]
+            raise RecognizerError("CUDA版本过低")
+        results = []
+        for film in films:
+            # 识别线程读取host上当前底片的状态
+            self.host.yuan_juzhen = film.matrix
+            self.host.hanfeng_start = film.seam_top
+            self.host.hanfeng_end = film.seam_bottom
+            self.host.dataThread.start()
+            self.host.dataThread.wait()
+            results.append(list(self.host.All_Info))
+        return results
+
+class CpuRecognizer(Recognizer):
+    """
+    CPU识别后端, 一次处理多张底片
+    detect_fn(matrix) -> (digits_info, 倍数); batched=True时为 detect_fn([matrix, ...]) -> [(digits_info, 倍数), ...]
+    非batched时用线程池并行处理一批底片(numpy/推理库在计算时会释放GIL)
+    """
+
+    def __init__(self, detect_fn, batch_size=4, workers=4, batched=False):
+        self.detect_fn = detect_fn
+        self.batch_size = batch_size
+        self.workers = workers
+        self.batched = batched
+
+    def _detect_one(self, film):
+        try:
+            digits_info, multiplier = self.detect_fn(film.matrix)
+        except Exception as e:
+            return RecognizerError(f"识别异常: {e}")
+        return [film.path, digits_info, multiplier]
+
+    def recognize_batch(self, films):
+        if self.batched:
+            try:
+                outputs = list(self.detect_fn([film.matrix for film in films]))
+            except Exception as e:
+                raise RecognizerError(f"识别异常: {e}")
+            # 结果数量不一致时无法确定对应关系, 整批按失败处理
+            if len(outputs) != len(films):
+                raise RecognizerError(f"识别结果数量({len(outputs)})与底片数量({len(films)})不一致")
+            results = []
+            for film, output in zip(films, outputs):
+                try:
+                    digits_info, multiplier = output
+                except Exception:
+                    results.append(RecognizerError(f"识别异常: {output}"))
+                    continue
+                results.append([film.path, digits_info, multiplier])
+            return results
+        if self.workers <= 1 or len(films) <= 1:
+            return [self._detect_one(film) for film in films]
+        with ThreadPoolExecutor(max_workers=min(self.workers, len(films))) as pool:
+            return list(pool.map(self._detect_one, films))
+
+def json_default(obj):
+    """识别结果中的numpy数值/数组转换为JSON可写的类型"""
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    raise TypeError(f"无法写入JSON的类型: {type(obj).__name__}")
+
+def replay_record_path(record_dir, film_path):
+    """回放记录文件路径: <record_dir>/<底片名(小写)>.json"""
+    base = os.path.splitext(os.path.basename(film_path))[0]
+    return os.path.join(record_dir, base.strip().lower() + '.json')
+
+class ReplayRecognizer(Recognizer):
+    """回放后端: 从record_dir读取预先录制的All_Info, 不需要GPU和模型"""
+
+    def __init__(self, record_dir, batch_size=4):
+        self.record_dir = record_dir
+        self.batch_size = batch_size
+
+    def recognize_batch(self, films):
+        results = []
+        for film in films:
+            try:
+                with open(replay_record_path(self.record_dir, film.path), 'r', encoding='utf-8') as f:
+                    all_info = json.load(f)
+            except (OSError, ValueError):
+                results.append(RecognizerError("无回放记录"))
+                continue
+            # 以当前底片路径为准, 录制环境的路径可能不同
+            all_info[0] = film.path
+            results.append(all_info)
+        return results
+
+class RecordingRecognizer(Recognizer):
+    """录制包装器: 调用inner识别, 并把成功的结果保存到record_dir供ReplayRecognizer回放"""
+
+    def __init__(self, inner, record_dir):
+        self.inner = inner
+        self.record_dir = record_dir
+        self.batch_size = inner.batch_size
+        os.makedirs(record_dir, exist_ok=True)
+
+    def recognize_batch(self, films):
+        results = self.inner.recognize_batch(films)
+        for film, all_info in zip(films, results):
+            if isinstance(all_info, Exception):
+                continue
+            # 录制只是附带功能, 写入失败不影响识别结果
+            record_path = replay_record_path(self.record_dir, film.path)
+            tmp_path = record_path + '.tmp'
+            try:
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(all_info, f, ensure_ascii=False, default=json_default)
+                os.replace(tmp_path, record_path)
+            except Exception as e:
+                print(f"警告: 保存识别记录失败 {record_path}: {e}")
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+        return results
+
+class CropRenderer:
+    """
+    裁剪区域渲染: 高位深数据按窗口映射到8位, 再缩小到截图宽度
+    窗口是每次裁剪的百分位, 几乎每次都不同, 因此不用查找表, 直接向量化线性缩放; 输出写入可复用的缓冲区
+    缩小时先整数倍reduce再重采样, 避免从原分辨率直接插值
+    """
+
+    def __init__(self, target_width=SCREENSHOT_WIDTH_PX, percentiles=WINDOW_PERCENTILES,
+                 sample_step=WINDOW_SAMPLE_STEP):
+        self.target_width = target_width
+        self.percentiles = percentiles
+        self.sample_step = sample_step
+        self._out_buf = np.empty(0, dtype=np.uint8)
+        self._float_buf = np.empty(0, dtype=np.float32)
+
+    @staticmethod
+    def _view(buf, shape):
+        """从扁平缓冲区取出指定形状的视图"""
+        return buf[:int(np.prod(shape))].reshape(shape)
+
+    def _reserve(self, shape):
+        """按需扩容缓冲区, 返回(uint8视图, float32视图)"""
+        size = int(np.prod(shape))
+        if self._out_buf.size < size:
+            self._out_buf = np.empty(size, dtype=np.uint8)
+            self._float_buf = np.empty(size, dtype=np.float32)
+        return self._view(self._out_buf, shape), self._view(self._float_buf, shape)
+
+    def window(self, array):
+        """计算窗口(下限, 上限), 只对抽样像素统计百分位"""
+        step = self.sample_step
+        sample = array[::step, ::step] if array.ndim >= 2 else array
+        lo, hi = np.percentile(sample, self.percentiles)
+        lo, hi = float(lo), float(hi)
+        if hi <= lo:
+            hi = lo + 1.0
+        return lo, hi
+
+    def to_uint8(self, array):
+        """窗口映射到8位, 返回缓冲区视图(下次调用会被覆盖)"""
+        if array.dtype == np.uint8:
+            return array
+        out, fbuf = self._reserve(array.shape)
+        lo, hi = self.window(array)
+        np.subtract(array, lo, out=fbuf, casting='unsafe')
+        np.multiply(fbuf, 255.0 / (hi - lo), out=fbuf)
+        np.clip(fbuf, 0, 255, out=fbuf)
+        np.copyto(out, fbuf, casting='unsafe')
+        return out
+
+    def render(self, cropped_array):
+        """返回缩放到target_width宽的PIL图像"""
+        data = self.to_uint8(cropped_array)
+        mode = 'L' if data.ndim == 2 else 'RGB'
+        pil_img = Image.fromarray(data, mode=mode)
+
+        img_w, img_h = pil_img.size
+        new_w = self.target_width
+        new_h = max(1, int(img_h * new_w / img_w))
+        if img_w > new_w:
+            # reducing_gap: 先按整数倍reduce, 再用双线性重采样到目标尺寸
+            return pil_img.resize((new_w, new_h), Image.BILINEAR, reducing_gap=2.0)
+        return pil_img.resize((new_w, new_h), Image.BILINEAR)
+
+class ImageEmbedder:
+    """
+    截图嵌入: 按像素内容哈希去重, 相同截图只编码一次
+    可配置JPEG质量和最大边长; 设定总字节预算后, 若已用字节超过按进度分摊的预算,
+    后续截图逐步降低质量, 降到最低质量后再缩小分辨率(单元格中的显示尺寸不变)
+    设置spill_dir后截图写入该目录(按内容哈希命名), 工作簿只引用文件路径, 不在内存中保留图片数据
+    """
+
+    def __init__(self, quality=JPEG_QUALITY, max_side=MAX_IMAGE_SIDE, byte_budget=IMAGE_BYTE_BUDGET,
+                 min_quality=JPEG_MIN_QUALITY, spill_dir=None):
+        self.quality = quality
+        self.max_side = max_side
+        self.byte_budget = byte_budget
+        self.min_quality = min_quality
+        self.spill_dir = spill_dir
+        # 预计截图数量, 用于按进度分摊预算; 为0时只与总预算比较
+        self.expected = 0
+        self.current_quality = quality
+        self.scale = 1.0
+        self._cache = {}
+        self.total_bytes = 0
+        self.unique = 0
+        self.duplicates = 0
+
+    def _over_budget(self):
+        if not self.byte_budget:
+            return False
+        if self.expected > self.unique:
+            return self.total_bytes > self.byte_budget * self.unique / self.expected
+        return self.total_bytes > self.byte_budget
+
+    def _degrade(self):
+        """降低后续截图的质量, 到下限后缩小分辨率"""
+        if self.current_quality > self.min_quality:
+            self.current_quality = max(self.min_quality, self.current_quality - 10)
+        else:
+            self.scale = max(0.25, self.scale * 0.75)
+
+    def encode(self, pil_img):
+        """
+        返回截图引用: 未设置spill_dir时为JPEG字节, 否则为落盘后的文件路径
+        像素内容相同的截图直接复用已编码结果
+        """
+        digest = hashlib.sha1(pil_img.tobytes())
+        digest.update(f"{pil_img.mode}{pil_img.size}".encode())
+        key = digest.hexdigest()
+        data = self._cache.get(key)
+        if data is not None:
+            self.duplicates += 1
+            return data
+
+        img = pil_img
+        if self.max_side:
+            limit = max(16, int(self.max_side * self.scale))
+            if max(img.size) > limit:
+                img = img.copy()
+                img.thumbnail((limit, limit), Image.BILINEAR)
+        buf = BytesIO()
+        img.save(buf, format="JPEG", quality=self.current_quality, optimize=True)
+        data = buf.getvalue()
+        self.total_bytes += len(data)
+        self.unique += 1
+        if self._over_budget():
+            self._degrade()
+
+        if self.spill_dir:
+            os.makedirs(self.spill_dir, exist_ok=True)
+            img_path = os.path.join(self.spill_dir, key + '.jpg')
+            if not os.path.exists(img_path):
+                with open(img_path, 'wb') as f:
+                    f.write(data)
+            data = img_path
+        self._cache[key] = data
+        return data
+
+    def embed(self, ws, anchor_cell, pil_img):
+        """把截图插入到anchor_cell, 显示尺寸为pil_img的原始尺寸"""
+        return self.add(ws, anchor_cell, self.encode(pil_img), pil_img.size)
+
+    def add(self, ws, anchor_cell, data, size):
+        """把已编码的JPEG(字节或文件路径)插入到anchor_cell, size为显示尺寸(宽, 高)"""
+        xl_img = XLImage(data if isinstance(data, str) else BytesIO(data))
+        xl_img.width, xl_img.height = size
+        xl_img.anchor = anchor_cell  # 必须先设置 anchor
+        ws.add_image(xl_img)  # 然后再 add
+        return xl_img
+
+    def summary(self):
+        return (f"截图 {self.unique} 张(去重复用 {self.duplicates} 次), "
+                f"图片共 {self.total_bytes / 1024 / 1024:.2f} MB, "
+                f"最终JPEG质量 {self.current_quality}, 缩放 {self.scale:.2f}")
+
+def dedupe_workbook_media(xlsx_path):
+    """
+    合并工作簿中内容相同的图片文件: 重复的media只保留一份, 绘图关系指向同一文件
+    openpyxl为每个插入的图片单独写一份media, 只能在保存后处理; 无重复时不改写文件
+    返回删除的重复图片数量
+    """
+    with zipfile.ZipFile(xlsx_path, 'r') as zin:
+        canonical = {}
+        replace = {}
+        for name in zin.namelist():
+            if not name.startswith('xl/media/'):
+                continue
+            key = hashlib.sha1(zin.read(name)).hexdigest()
+            if key in canonical:
+                replace['/' + name] = '/' + canonical[key]
+            else:
+                canonical[key] = name
+        if not replace:
+            return 0
+
+        target_re = re.compile(r'Target="(/xl/media/[^"]+)"')
+        tmp_path = xlsx_path + '.tmp'
+        with zipfile.ZipFile(tmp_path, 'w', zipfile.ZIP_DEFLATED) as zout:
+            for item in zin.infolist():
+                if '/' + item.filename in replace:
+                    continue
+                data = zin.read(item.filename)
+                if item.filename.startswith('xl/drawings/_rels/'):
+                    text = data.decode('utf-8')
+                    text = target_re.sub(lambda m: f'Target="{replace.get(m.group(1), m.group(1))}"', text)
+                    data = text.encode('utf-8')
+                # 图片本身已压缩, 不再deflate
+                compress = zipfile.ZIP_STORED if item.filename.startswith('xl/media/') else zipfile.ZIP_DEFLATED
+                zout.writestr(item, data, compress_type=compress)
+    os.replace(tmp_path, xlsx_path)
+    return len(replace)
+
+def save_workbook(wb, path, embedder=None):
+    """保存工作簿, 合并重复图片, 并输出耗时和文件大小"""
+    t0 = time.perf_counter()
+    wb.save(path)
+    removed = 0
+    if embedder is not None and embedder.duplicates:
+        removed = dedupe_workbook_media(path)
+    elapsed = time.perf_counter() - t0
+    size_mb = os.path.getsize(path) / 1024 / 1024
+    print(f"保存Excel: 耗时 {elapsed:.2f} s, 文件大小 {size_mb:.2f} MB"
+          + (f", 合并重复图片 {removed} 张" if removed else ""))
+    if embedder is not None:
+        print(embedder.summary())
+    return elapsed
+
+class ScreenshotJournal:
+    """
+    截图进度日志: 每插入成功一行就追加一条JSON记录(行号、焊口编号、图片文件、显示尺寸、行高)
+    截图文件保存在image_dir中, 中断后以resume模式重新运行时跳过已完成的行并从文件恢复截图
+    """
+
+    def __init__(self, excel_path, resume=False):
+        stem = os.path.splitext(os.path.basename(excel_path))[0]
+        self.path = os.path.splitext(os.path.abspath(excel_path))[0] + '.journal.jsonl'
+        # 日志中保存绝对路径, 从其他工作目录续跑时仍能找到截图文件
+        self.image_dir = os.path.abspath(os.path.join(TMP_SAVE_DIR, stem))
+        self.entries = {}
+        if resume:
+            self._load()
+        # 非resume模式重新开始记录
+        self._file = open(self.path, 'a' if resume else 'w', encoding='utf-8')
+
+    def _load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # 中断时可能写了半行
+                        continue
+                    if os.path.exists(entry.get('image', '')):
+                        self.entries[entry['row']] = entry
+        except OSError:
+            pass
+
+    def is_done(self, row):
+        return row in self.entries
+
+    def record(self, row, weld_id, image_path, size, row_height):
+        entry = {'row': row, 'weld_id': weld_id, 'image': os.path.abspath(image_path),
+                 'width': size[0], 'height': size[1], 'row_height': row_height}
+        self.entries[row] = entry
+        self._file.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        self._file.flush()
+
+    def sync(self):
+        """检查点时把日志刷到磁盘"""
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def restore(self, ws, headers, embedder):
+        """
+        把日志中已完成行的截图重新插入ws, 返回恢复的行数
+        焊口编号与当前表格不一致的记录视为未完成
+        """
+        col_weld_idx = headers[COL_WELD]
+        target_col_letter = get_column_letter(headers[COL_SCREENSHOT])
+        # 检查点保存的工作簿里已有截图, 统一以日志为准重新插入
+        ws._images = []
+        restored = 0
+        seen_images = set()
+        for row, entry in sorted(self.entries.items()):
+            weld_id = str(ws.cell(row=row, column=col_weld_idx).value).strip()
+            if weld_id != entry['weld_id']:
+                del self.entries[row]
+                continue
+            ws.column_dimensions[target_col_letter].width = SCREENSHOT_COL_WIDTH
+            ws.row_dimensions[row].height = entry['row_height']
+            embedder.add(ws, f"{target_col_letter}{row}", entry['image'], (entry['width'], entry['height']))
+            restored += 1
+            # 共用同一文件的截图计入重复, 保存后合并; 不同文件计入已用字节预算
+            if entry['image'] in seen_images:
+                embedder.duplicates += 1
+            else:
+                embedder.total_bytes += os.path.getsize(entry['image'])
+                embedder.unique += 1
+                # 截图文件按内容哈希命名, 本次再遇到相同截图时直接复用
+                embedder._cache.setdefault(os.path.splitext(os.path.basename(entry['image']))[0], entry['image'])
+            seen_images.add(entry['image'])
+        return restored
+
+    def close(self):
+        self._file.close()
+
+class RowReport:
+    """
+    逐行处理记录: 焊口编号、底片、结果代码、签字对、裁剪矩形及解码/识别/裁剪/插入耗时
+    解码和识别按底片进行, 同一底片的各行记录相同的底片耗时, 统计分位数时按底片去重
+    """
+    STAGES = ('decode', 'recognize', 'crop', 'insert')
+    FIELDS = ['row', 'weld_id', 'film', 'outcome', 'reason', 'sign_pair', 'crop_rect',
+              'decode_ms', 'recognize_ms', 'crop_ms', 'insert_ms', 'film_rows']
+
+    def __init__(self):
+        self.records = []
+
+    def new(self, row, weld_id):
+        record = {field: '' for field in self.FIELDS}
+        record.update({'row': row, 'weld_id': weld_id, 'decode_ms': 0.0, 'recognize_ms': 0.0,
+                       'crop_ms': 0.0, 'insert_ms': 0.0, 'film_rows': 0})
+        self.records.append(record)
+        return record
+
+    def restore(self, excel_path, journal):
+        """
+        断点续跑: 从上次的报告中取回日志中已完成行的记录, 与本次新处理的行合并后统计
+        上次报告缺失或记录不一致的行补一条结果为ok的恢复记录(无耗时)
+        """
+        previous = {}
+        try:
+            with open(os.path.splitext(os.path.abspath(excel_path))[0] + '_report.json', 'r', encoding='utf-8') as f:
+                for record in json.load(f).get('records', []):
+                    previous[record['row']] = record
+        except (OSError, ValueError):
+            pass
+        for row, entry in sorted(journal.entries.items()):
+            record = self.new(row, entry['weld_id'])
+            old = previous.get(row)
+            if old is not None and old.get('outcome') == 'ok' and old.get('weld_id') == entry['weld_id']:
+                record.update({field: old[field] for field in self.FIELDS if field in old})
+            else:
+                record['outcome'] = 'ok'
+                record['reason'] = '断点续跑恢复'
+        return len(journal.entries)
+
+    def summary(self):
+        """按结果代码计数, 各阶段耗时分位数, 以及总耗时最多的底片"""
+        outcomes = {}
+        for record in self.records:
+            outcomes[record['outcome']] = outcomes.get(record['outcome'], 0) + 1
+
+        film_times = {}
+        for record in self.records:
+            if not record['film']:
+                continue
+            t = film_times.setdefault(record['film'], {'decode': record['decode_ms'],
+                                                       'recognize': record['recognize_ms'], 'rows': 0, 'total': 0.0})
+            t['rows'] += 1
+            t['total'] += record['crop_ms'] + record['insert_ms']
+        for t in film_times.values():
+            t['total'] += t['decode'] + t['recognize']
+
+        stages = {}
+        for stage in self.STAGES:
+            if stage in ('decode', 'recognize'):
+                values = [t[stage] for t in film_times.values()]
+            else:
+                values = [r[stage + '_ms'] for r in self.records if r[stage + '_ms']]
+            if values:
+                p50, p90, p99 = np.percentile(values, [50, 90, 99])
+                stages[stage] = {'count': len(values), 'total_ms': float(sum(values)), 'p50_ms': float(p50),
+                                 'p90_ms': float(p90), 'p99_ms': float(p99), 'max_ms': float(max(values))}
+            else:
+                stages[stage] = {'count': 0}
+
+        slowest = sorted(film_times.items(), key=lambda kv: kv[1]['total'], reverse=True)[:10]
+        return {'rows': len(self.records), 'outcomes': outcomes, 'stages': stages,
+                'slowest_films': [{'film': film, 'rows': t['rows'], 'total_ms': t['total']} for film, t in slowest]}
+
+    def write(self, excel_path):
+        """在工作簿旁写出 <名称>_report.csv 和 <名称>_report.json, 返回汇总"""
+        stem = os.path.splitext(os.path.abspath(excel_path))[0]
+        summary = self.summary()
+        for record in self.records:
+            for stage in self.STAGES:
+                record[stage + '_ms'] = round(record[stage + '_ms'], 3)
+        # utf-8-sig便于Excel直接打开中文CSV
+        with open(stem + '_report.csv', 'w', encoding='utf-8-sig', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=self.FIELDS)
+            writer.writeheader()
+            writer.writerows(self.records)
+        with open(stem + '_report.json', 'w', encoding='utf-8') as f:
+            json.dump({'summary': summary, 'records': self.records}, f, ensure_ascii=False, indent=1)
+
+        print(f"\n===== 逐行报告: {stem}_report.csv / .json =====")
+        print("结果: " + ', '.join(f"{OUTCOMES.get(k, k)}({k})={v}" for k, v in summary['outcomes'].items()))
+        for stage, st in summary['stages'].items():
+            if st['count']:
+                print(f"  {stage:<10} n={st['count']:<6} p50={st['p50_ms']:.1f}ms p90={st['p90_ms']:.1f}ms "
+                      f"p99={st['p99_ms']:.1f}ms max={st['max_ms']:.1f}ms")
+        return summary
+
+def row_failed(record, outcome, detail=None):
+    """记录并输出失败原因"""
+    reason = OUTCOMES[outcome] if detail is None else detail
+    record['outcome'] = outcome
+    record['reason'] = reason
+    print(f"  Row {record['row']}，焊口 {record['weld_id']}: 失败，原因={reason}")
+    return False
 
 def parse_digits_info(digits_info):
     """
@@ -132,47 +836,165 @@ def compute_crop_rect(left_sign, right_sign, seam_top, seam_bottom):
 
     return int(left), int(top), int(right), int(bottom)
 
-def run(self):
-    # 创建临时保存目录
-    os.makedirs(TMP_SAVE_DIR, exist_ok=True)
-    # 加载Excel文件
-    if not os.path.exists(self.excel_path):
-        print(f"错误: Excel文件不存在: {self.excel_path}")
-        return
-    wb = load_workbook(self.excel_path)
-    ws = wb.active
-    # 解析表头
-    header_row = 1
+def read_headers(ws, header_row=1):
+    """读取表头, 返回 {列名: 列号}"""
     headers = {}
     for col in range(1, ws.max_column + 1):
         val = ws.cell(row=header_row, column=col).value
         if val is not None:
             headers[str(val).strip()] = col
-    # 检查必需列
-    if COL_WELD not in headers or COL_START not in headers or COL_END not in headers or COL_SCREENSHOT not in headers:
-        print(f"错误: Excel缺少必需列。找到的列: {list(headers.keys())}")
-        return
+    return headers
+
+def load_film(self, file_path):
+    """调用self.process解码底片并获取焊缝边界, 返回FilmData"""
+    # 初始化焊缝区域
+    self.hanfeng_start = 0
+    self.hanfeng_end = 0
+    # 调用process获取焊缝边界
+    self.process(file_path)
+    return FilmData(file_path, self.yuan_juzhen, self.hanfeng_start, self.hanfeng_end)
+
+def screenshot_row(self, ws, r, weld_id, start_mm, end_mm, film, all_info, col_screenshot_idx, renderer=None,
+                   embedder=None, journal=None, record=None):
+    """
+    根据识别结果为单个标红行裁剪并插入截图
+    record: RowReport中的行记录, 写入结果、签字对、裁剪矩形和耗时
+    返回是否插入成功
+    """
+    if record is None:
+        record = RowReport().new(r, weld_id)
+    # 提取信息
+    file_name = all_info[0]
+    digits_info = all_info[1]
+    digit_multiplier = all_info[2]
+    hanfeng_start = film.seam_top
+    hanfeng_end = film.seam_bottom
+    xiangsu_chicun = self.pix_lenth
+    juzhen = film.matrix
+    # 检查签字信息
+    if not digits_info:
+        return row_failed(record, 'no_digits')
+
+    t_crop = time.perf_counter()
+
+    # 解析签字信息
+    sign_dict = parse_digits_info(digits_info)
+
+    # 查找签字对
+    sign_pair = find_sign_pair_for_defect(sign_dict, start_mm, end_mm, digit_multiplier)
+    if sign_pair is None:
+        record['crop_ms'] = (time.perf_counter() - t_crop) * 1000
+        return row_failed(record, 'no_sign_pair')
+
+    left_sign, right_sign = sign_pair
+    record['sign_pair'] = f"{left_sign[0]}-{right_sign[0]}"
+
+    # 计算裁剪矩形
+    left, top, right, bottom = compute_crop_rect(left_sign, right_sign, hanfeng_start, hanfeng_end)
+
+    # 修正到图像边界
+    img_h, img_w = juzhen.shape[:2]
+    left = max(0, left)
+    top = max(0, top)
+    right = min(img_w, right)
+    bottom = min(img_h, bottom)
+    record['crop_rect'] = f"{left},{top},{right},{bottom}"
+
+    # 检查尺寸
+    if right - left < 5 or bottom - top < 5:
+        record['crop_ms'] = (time.perf_counter() - t_crop) * 1000
+        return row_failed(record, 'crop_too_small')
+
+    # 从像素矩阵裁剪图像
+    cropped_array = juzhen[top:bottom, left:right]
+
+    # 窗口映射到8位并缩放到截图列宽
+    if renderer is None:
+        renderer = CropRenderer()
+    pil_img = renderer.render(cropped_array)
+    new_w, new_h = pil_img.size
+    record['crop_ms'] = (time.perf_counter() - t_crop) * 1000
+
+    # 插入Excel（优化版）
+    t_insert = time.perf_counter()
+    try:
+        target_col_letter = get_column_letter(col_screenshot_idx)
+
+        # ① 固定截图列宽
+        ws.column_dimensions[target_col_letter].width = SCREENSHOT_COL_WIDTH
+
+        # ② 计算行高 pt（像素 × 0.75），但行高不能低于默认 15pt
+        desired_row_height = new_h * 0.75
+        MIN_ROW_HEIGHT_PT = 15
+        final_row_height = max(desired_row_height, MIN_ROW_HEIGHT_PT)
+        ws.row_dimensions[r].height = final_row_height
+
+        # ③ 插入图片，并允许随单元格移动/改变大小
+        if embedder is None:
+            embedder = ImageEmbedder()
+        xl_img = embedder.embed(ws, f"{target_col_letter}{r}", pil_img)
+        if journal is not None:
+            journal.record(r, weld_id, xl_img.ref, pil_img.size, final_row_height)
+
+        print(f"  Row {r}, 焊口 {weld_id}: 插入成功，起始={start_mm}, 结束={end_mm}, 倍数={digit_multiplier}，"
+              f"签字对={left_sign[0], right_sign[0]}, "
+              f"签字坐标={(int(left_sign[1]), int(left_sign[2])), (int(right_sign[1]), int(right_sign[2]))}, "
+              f"裁剪={left, top, right, bottom}")
+
+    except Exception as e_img:
+        record['insert_ms'] = (time.perf_counter() - t_insert) * 1000
+        return row_failed(record, 'insert_error', f"插入图片异常: {str(e_img)}")
+
+    record['insert_ms'] = (time.perf_counter() - t_insert) * 1000
+    record['outcome'] = 'ok'
+    record['reason'] = OUTCOMES['ok']
+    return True
+
+def insert_screenshots(self, ws, red_rows, headers, embedder=None, journal=None, checkpoint=None, report=None):
+    """
+    对给定的标红行定位底片、识别签字、裁剪并插入截图
+    同一底片的多行只解码、识别一次; 底片按识别后端的batch_size成批识别
+    red_rows: 标红行号列表; headers: read_headers()的结果; embedder: 截图嵌入器(ImageEmbedder)
+    journal: 进度日志(ScreenshotJournal), 已完成的行直接跳过
+    checkpoint: 每完成CHECKPOINT_EVERY行调用一次的保存函数
+    report: 逐行处理记录(RowReport)
+    返回成功插入的图片数量(不含跳过的行)
+    """
     col_weld_idx = headers[COL_WELD]
     col_start_idx = headers[COL_START]
     col_end_idx = headers[COL_END]
     col_screenshot_idx = headers[COL_SCREENSHOT]
-    total_rows = 0
-    red_rows_found = 0
+    # 底片索引: 优先使用外部传入的定位器, 否则扫描self.dcm_path(可为多个目录)
+    film_locator = getattr(self, 'film_locator', None)
+    if film_locator is None:
+        film_locator = FilmLocator.open(self.dcm_path, recursive=FILM_RECURSIVE, cache_path=FILM_INDEX_CACHE)
+    print(f"底片索引: {len(film_locator.index)} 个底片, {len(film_locator.dirs)} 个目录")
+    # 识别后端: 优先使用外部传入的后端, 否则使用self.dataThread
+    recognizer = getattr(self, 'recognizer', None)
+    if recognizer is None:
+        recognizer = DataThreadRecognizer(self)
+    # 截图渲染器, 缓冲区在各行之间复用
+    renderer = getattr(self, 'crop_renderer', None)
+    if renderer is None:
+        renderer = CropRenderer()
+    if embedder is None:
+        embedder = ImageEmbedder()
+    # 预算按全部标红行分摊, 续跑时包含已恢复的行
+    embedder.expected = len(red_rows)
+    if journal is not None:
+        red_rows = [r for r in red_rows if not journal.is_done(r)]
+    if report is None:
+        report = RowReport()
     images_inserted = 0
-    print("\n开始遍历Excel记录...")
 
-    # 遍历数据行
-    for r in range(header_row + 1, ws.max_row + 1):
-        total_rows += 1
+    # 第一步: 读取各行信息并按底片分组
+    film_rows = {}
+    for r in red_rows:
+        record = report.new(r, '')
         try:
-            # 检查是否为红色行，如果未标红，则跳过；如果标红，则继续下面逻辑
-            if not is_row_red(ws, r):
-                continue
-
-            red_rows_found += 1
-
             # 获取焊口编号、起始位置、结束位置
             weld_id = str(ws.cell(row=r, column=col_weld_idx).value).strip()
+            record['weld_id'] = weld_id
             start_val_raw = ws.cell(row=r, column=col_start_idx).value
             end_val_raw = ws.cell(row=r, column=col_end_idx).value
 
@@ -181,142 +1003,223 @@ def run(self):
                 start_mm = float(start_val_raw)
                 end_mm = float(end_val_raw)
             except:
-                print(f"  Row {r}，焊口 {weld_id}: 失败，原因=起始/结束位置非数字")
+                row_failed(record, 'bad_position')
                 continue
 
             # 定位底片文件
-            file_path = find_file_with_extension(self.dcm_path, weld_id)
+            file_path = film_locator.find(weld_id)
             if file_path is None:
-                print(f"  Row {r}，焊口 {weld_id}: 失败，原因=未找到底片文件")
-                continue
-
-            # 初始化焊缝区域
-            self.hanfeng_start = 0
-            self.hanfeng_end = 0
-            # 调用process获取焊缝边界
-            self.process(file_path)
-            # 调用识别获取签字和倍数信息
-            if self.dataThread.cuda_version_float >= 11.3:
-                self.dataThread.start()
-                self.dataThread.wait()
-            else:
-                self.All_Info = [0, [], 10]
-                print(f"  Row {r}，焊口 {weld_id}: 失败，原因=CUDA版本过低")
-                continue
-            # 提取信息
-            file_name = self.All_Info[0]
-            digits_info = self.All_Info[1]
-            digit_multiplier = self.All_Info[2]
-            hanfeng_start = self.hanfeng_start
-            hanfeng_end = self.hanfeng_end
-            xiangsu_chicun = self.pix_lenth
-            juzhen = self.yuan_juzhen
-            # 检查签字信息
-            if not digits_info:
-                print(f"  Row {r}，焊口 {weld_id}: 失败，原因=签字信息为空")
-                continue
-
-            # 解析签字信息
-            sign_dict = parse_digits_info(digits_info)
-
-            # 查找签字对
-            sign_pair = find_sign_pair_for_defect(sign_dict, start_mm, end_mm, digit_multiplier)
-            if sign_pair is None:
-                print(f"  Row {r}，焊口 {weld_id}: 失败，原因=未能找到合适的签字对")
-                continue
-
-            left_sign, right_sign = sign_pair
-
-            # 计算裁剪矩形
-            left, top, right, bottom = compute_crop_rect(left_sign, right_sign, hanfeng_start, hanfeng_end)
-
-            # 修正到图像边界
-            img_h, img_w = juzhen.shape[:2]
-            left = max(0, left)
-            top = max(0, top)
-            right = min(img_w, right)
-            bottom = min(img_h, bottom)
-
-            # 检查尺寸
-            if right - left < 5 or bottom - top < 5:
-                print(f"  Row {r}，焊口 {weld_id}: 失败，原因=裁剪尺寸过小")
+                row_failed(record, 'film_not_found')
                 continue
 
-            # 从像素矩阵裁剪图像
-            cropped_array = juzhen[top:bottom, left:right]
+            record['film'] = file_path
+            film_rows.setdefault(file_path, []).append((r, weld_id, start_mm, end_mm, record))
 
-            # 转换为PIL图像
-            if len(cropped_array.shape) == 2:
-                # 灰度图
-                pil_img = Image.fromarray(cropped_array.astype('uint8'), mode='L')
-            else:
-                # 彩色图
-                pil_img = Image.fromarray(cropped_array.astype('uint8'), mode='RGB')
+        except Exception as e_row:
+            traceback.print_exc()
+            row_failed(record, 'row_error', f"处理行时异常: {str(e_row)}")
+            continue
 
-            # 保存临时图片
-            tmp_img_path = os.path.join(TMP_SAVE_DIR, f"{weld_id}_{r}.jpg")
-            pil_img.save(tmp_img_path, format="JPEG")
+    # 第二步: 成批解码、识别底片, 再处理该底片上的所有行
+    film_paths = list(film_rows.keys())
+    batch_size = max(1, getattr(recognizer, 'batch_size', 1))
+    for b in range(0, len(film_paths), batch_size):
+        batch_paths = film_paths[b:b + batch_size]
+        films = {}
+        decode_errors = {}
+        decode_ms = {}
+        # 逐张解码, 单张底片读取失败不影响同批其它底片
+        for path in batch_paths:
+            t0 = time.perf_counter()
+            try:
+                films[path] = load_film(self, path)
+            except Exception as e_film:
+                traceback.print_exc()
+                decode_errors[path] = e_film
+            decode_ms[path] = (time.perf_counter() - t0) * 1000
 
-            # 插入Excel（优化版）
+        # 只把解码成功的底片送去识别
+        decoded = [path for path in batch_paths if path in films]
+        all_infos = {}
+        recognize_ms = 0.0
+        if decoded:
+            t0 = time.perf_counter()
             try:
-                target_col_letter = get_column_letter(col_screenshot_idx)
+                results = recognizer.recognize_batch([films[path] for path in decoded])
+                if len(results) != len(decoded):
+                    raise RecognizerError(f"识别结果数量({len(results)})与底片数量({len(decoded)})不一致")
+                all_infos = dict(zip(decoded, results))
+            except Exception as e_batch:
+                if not isinstance(e_batch, RecognizerError):
+                    traceback.print_exc()
+                all_infos = {path: e_batch for path in decoded}
+            recognize_ms = (time.perf_counter() - t0) * 1000 / len(decoded)
 
-                # ① 固定截图列宽为 16
-                fixed_col_width = 16
-                ws.column_dimensions[target_col_letter].width = fixed_col_width
+        for file_path in batch_paths:
+            rows = film_rows[file_path]
+            all_info = all_infos.get(file_path)
+            for r, weld_id, start_mm, end_mm, record in rows:
+                # 底片级耗时, 成批识别时按张数平均
+                record['decode_ms'] = decode_ms[file_path]
+                record['recognize_ms'] = recognize_ms if file_path in films else 0.0
+                record['film_rows'] = len(rows)
+                if file_path in decode_errors:
+                    row_failed(record, 'decode_failed', f"底片读取失败: {decode_errors[file_path]}")
+                    continue
+                if all_info is None or isinstance(all_info, Exception):
+                    row_failed(record, 'recognize_failed', str(all_info) if all_info is not None else None)
+                    continue
+                try:
+                    self.All_Info = all_info
+                    if not screenshot_row(self, ws, r, weld_id, start_mm, end_mm, films[file_path], all_info,
+                                          col_screenshot_idx, renderer, embedder, journal, record):
+                        continue
+                except Exception as e_row:
+                    traceback.print_exc()
+                    row_failed(record, 'row_error', f"处理行时异常: {str(e_row)}")
+                    continue
+                images_inserted += 1
+                if checkpoint is not None and images_inserted % CHECKPOINT_EVERY == 0:
+                    # 检查点失败不影响已插入的行, 下一个检查点或最终保存时再写
+                    try:
+                        checkpoint()
+                    except Exception as e_ckpt:
+                        print(f"  警告: 保存检查点失败: {e_ckpt}")
+        # 释放本批底片的像素矩阵
+        films = None
 
-                # ② 计算列宽像素（Excel 字符宽换算）
-                col_width_px = int(fixed_col_width * 7)
+    return images_inserted
 
-                # 原图大小
-                img_w, img_h = pil_img.size
+def make_checkpoint(wb, path, journal):
+    """生成检查点保存函数: 先写临时文件再替换, 避免保存中断损坏工作簿"""
+    def checkpoint():
+        t0 = time.perf_counter()
+        tmp_path = path + '.tmp'
+        wb.save(tmp_path)
+        os.replace(tmp_path, path)
+        journal.sync()
+        print(f"  检查点已保存: 已完成 {len(journal.entries)} 行, 耗时 {time.perf_counter() - t0:.2f} s")
+    return checkpoint
 
-                # ③ 按列宽缩放，使图像横向恰好占满单元格
-                scale_w = col_width_px / img_w
-                new_w = col_width_px
-                new_h = int(img_h * scale_w)
+def prepare_journal(self, ws, headers, resume):
+    """创建进度日志和落盘的截图嵌入器; resume时恢复已完成行的截图"""
+    journal = ScreenshotJournal(self.excel_path, resume=resume)
+    embedder = getattr(self, 'image_embedder', None) or ImageEmbedder()
+    if embedder.spill_dir is None:
+        embedder.spill_dir = journal.image_dir
+    if resume:
+        restored = journal.restore(ws, headers, embedder)
+        print(f"断点续跑: 已恢复 {restored} 行截图")
+    return journal, embedder
 
-                # ④ 计算行高 pt（像素 × 0.75），但行高不能低于默认 15pt
-                desired_row_height = new_h * 0.75
-                MIN_ROW_HEIGHT_PT = 15
-                final_row_height = max(desired_row_height, MIN_ROW_HEIGHT_PT)
-                ws.row_dimensions[r].height = final_row_height
+def has_required_columns(headers):
+    """检查截图所需的列是否齐全"""
+    return all(col in headers for col in (COL_WELD, COL_START, COL_END, COL_SCREENSHOT))
 
-                # ⑤ 生成缩放后的图片并覆盖保存
-                pil_img_resized = pil_img.resize((new_w, new_h))
-                pil_img_resized.save(tmp_img_path)
+def run(self, resume=False):
+    """
+    为self.excel_path中的标红行插入截图
+    resume=True时根据进度日志跳过已完成的行(中断后续跑)
+    """
+    # 创建临时保存目录
+    os.makedirs(TMP_SAVE_DIR, exist_ok=True)
+    # 加载Excel文件
+    if not os.path.exists(self.excel_path):
+        print(f"错误: Excel文件不存在: {self.excel_path}")
+        return
+    wb = load_workbook(self.excel_path)
+    ws = wb.active
+    # 解析表头
+    header_row = 1
+    headers = read_headers(ws, header_row)
+    # 检查必需列
+    if not has_required_columns(headers):
+        print(f"错误: Excel缺少必需列。找到的列: {list(headers.keys())}")
+        return
+    print("\n开始遍历Excel记录...")
 
-                # ⑥ 插入图片，并允许随单元格移动/改变大小
-                xl_img = XLImage(tmp_img_path)
+    # 检查是否为红色行，只处理标红的行
+    total_rows = ws.max_row - header_row
+    red_rows = [r for r in range(header_row + 1, ws.max_row + 1) if is_row_red(ws, r)]
+    journal, embedder = prepare_journal(self, ws, headers, resume)
+    checkpoint = make_checkpoint(wb, self.excel_path, journal)
+    try:
+        report = RowReport()
+        if resume:
+            report.restore(self.excel_path, journal)
+        images_inserted = insert_screenshots(self, ws, red_rows, headers, embedder, journal, checkpoint, report)
 
-                anchor_cell = f"{target_col_letter}{r}"
-                xl_img.anchor = anchor_cell  # 必须先设置 anchor
-                ws.add_image(xl_img)  # 然后再 add
+        # 保存Excel
+        try:
+            save_workbook(wb, self.excel_path, embedder)
+            report.write(self.excel_path)
+            print(f"\n===== 插入图片操作完成 =====")
+            print(f"总行数扫描: {total_rows}")
+            print(f"检测到红色行: {len(red_rows)}")
+            print(f"成功插入图片: {images_inserted}")
+            print(f"累计完成: {len(journal.entries)}")
+        except Exception as e_save:
+            print(f"错误: 保存Excel时发生异常: {e_save}")
+    finally:
+        journal.close()
 
-                images_inserted += 1
-                print(f"  Row {r}, 焊口 {weld_id}: 插入成功，起始={start_mm}, 结束={end_mm}, 倍数={digit_multiplier}，"
-                      f"签字对={left_sign[0], right_sign[0]}, "
-                      f"签字坐标={(int(left_sign[1]), int(left_sign[2])), (int(right_sign[1]), int(right_sign[2]))}, "
-                      f"裁剪={left, top, right, bottom}")
+def run_pipeline(self, manual_path, intelligent_path, comparer=None, resume=False):
+    """
+    一体化流程: 对比 -> 计算标红行 -> 截图 -> 一次性保存
+    数据填色、统计报告和截图都在内存中的同一个工作簿里完成,
+    除检查点外只写一次self.excel_path, 不再先写出再用load_workbook重新读取
+    resume=True时重新对比后根据进度日志跳过已完成的截图行
+    """
+    os.makedirs(TMP_SAVE_DIR, exist_ok=True)
+    if comparer is None:
+        # 对比模块依赖pandas, 只在一体化流程中导入
+        from excelproject import ExcelComparer
+        comparer = ExcelComparer()
 
-            except Exception as e_img:
-                print(f"  Row {r}，焊口 {weld_id}: 失败，原因=插入图片异常: {str(e_img)}")
-                continue
+    try:
+        # 1. 加载并对比数据
+        comparer.manual_data = comparer.load_excel_data(manual_path)
+        comparer.intelligent_data = comparer.load_excel_data(intelligent_path)
+        comparer.compare_data()
 
-        except Exception as e_row:
-            traceback.print_exc()
-            print(f"  Row {r}: 失败，原因=处理行时异常: {str(e_row)}")
-            continue
+        # 2. 在内存中生成带颜色和统计报告的工作簿
+        df_output, color_info = comparer.build_output_rows()
+        wb = comparer.build_output_workbook(df_output, color_info)
+        ws = wb.worksheets[0]
+    except Exception as e:
+        print(f"\n错误: {str(e)}")
+        traceback.print_exc()
+        return False
 
-    # 保存Excel
+    # 3. 标红行直接由对比结果得出, 无需再读取单元格颜色
+    headers = read_headers(ws)
+    red_rows = [idx for idx, color in enumerate(color_info, start=2) if color == 'red']
+    print(f"\n开始插入截图, 标红行: {len(red_rows)}")
+    journal, embedder = prepare_journal(self, ws, headers, resume)
+    checkpoint = make_checkpoint(wb, self.excel_path, journal)
     try:
-        wb.save(self.excel_path)
-        print(f"\n===== 插入图片操作完成 =====")
-        print(f"总行数扫描: {total_rows}")
-        print(f"检测到红色行: {red_rows_found}")
-        print(f"成功插入图片: {images_inserted}")
-    except Exception as e_save:
-        print(f"错误: 保存Excel时发生异常: {e_save}")
+        report = RowReport()
+        if resume:
+            report.restore(self.excel_path, journal)
+        images_inserted = insert_screenshots(self, ws, red_rows, headers, embedder, journal, checkpoint, report)
+
+        # 4. 一次性保存
+        try:
+            save_workbook(wb, self.excel_path, embedder)
+        except Exception as e_save:
+            print(f"错误: 保存Excel时发生异常: {e_save}")
+            return False
+    finally:
+        journal.close()
+    report.write(self.excel_path)
+
+    comparer.generate_statistics_report()
+    print(f"\n===== 对比与截图完成 =====")
+    print(f"输出文件: {self.excel_path}")
+    print(f"总记录数: {len(df_output)}")
+    print(f"检测到红色行: {len(red_rows)}")
+    print(f"成功插入图片: {images_inserted}")
+    return True
             
 '''self.All_Info 的内容是：['C:\\Users\\user\\Desktop\\test\\LYY1T01-AC053-004-Z-X01.DICONDE', [{'center': [71.0, 1058.0], 'digit': 255, 'score': 1.0}, {'center': [423.0, 1024.75], 'digit': 260, 'score': 0.9999995231628418}, {'center': [726.5, 1018.5], 'digit': 5, 'score': 0.999998927116394}, {'center': [1101.0, 1020.5], 'digit': 10, 'score': 0.999431848526001}, {'center': [1836.75, 1020.5], 'digit': 20, 'score': 0.9999991655349731}, {'center': [2762.5, 1012.0], 'digit': 20, 'score': 0.9999916553497314}, {'center': [3132.0, 1008.0], 'digit': 25, 'score': 0.9999977946281433}, {'center': [3490.0, 1012.5], 'digit': 30, 'score': 0.9999971389770508}, {'center': [3867.5, 1018.0], 'digit': 35, 'score': 1.0}, {'center': [4799.0, 1009.0], 'digit': 35, 'score': 1.0}, {'center': [5164.0, 1007.5], 'digit': 40, 'score': 0.9998757243156433}, {'center': [5528.5, 1017.5], 'digit': 45, 'score': 0.9737262725830078}, {'center': [5905.5, 1026.5], 'digit': 50, 'score': 0.9999973177909851}, {'center': [6834.5, 1018.0], 'digit': 50, 'score': 0.9999986290931702}, {'center': [7199.5, 1010.5], 'digit': 55, 'score': 1.0}, {'center': [7564.5, 1010.0], 'digit': 60, 'score': 0.9999990463256836}, {'center': [7940.5, 1013.0], 'digit': 65, 'score': 0.9999999403953552}, {'center': [8866.5, 1004.5], 'digit': 65, 'score': 0.9999998807907104}, {'center': [9244.5, 1006.0], 'digit': 70, 'score': 0.999990701675415}, {'center': [9980.75, 1011.0], 'digit': 80, 'score': 0.9999991059303284}, {'center': [10904.0, 1004.0], 'digit': 80, 'score': 0.9999967813491821}, {'center': [11283.5, 1006.5], 'digit': 85, 'score': 1.0}, {'center': [11655.5, 1019.5], 'digit': 90, 'score': 0.999966025352478}, {'center': [12032.5, 1034.5], 'digit': 95, 'score': 0.9999997615814209}, {'center': [12945.0, 1027.5], 'digit': 95, 'score': 0.9999970197677612}, {'center': [13327.0, 1032.5], 'digit': 100, 'score': 0.9999012351036072}, {'center': [13707.5, 1041.5], 'digit': 105, 'score': 0.9997713565826416}, {'center': [14609.0, 1051.0], 'digit': 105, 'score': 0.9957727789878845}, {'center': [15743.5, 1037.0], 'digit': 120, 'score': 0.9999987483024597}, {'center': [16123.5, 1045.0], 'digit': 125, 'score': 0.9999999403953552}, {'center': [17030.0, 1033.5], 'digit': 125, 'score': 0.9999974370002747}, {'center': [17413.0, 1031.0], 'digit': 130, 'score': 0.9999942779541016}, {'center': [17789.0, 1028.5], 'digit': 135, 'score': 0.9999980330467224}, {'center': [18167.5, 1038.0], 'digit': 140, 'score': 0.9999971985816956}, {'center': [19071.0, 1030.0], 'digit': 140, 'score': 0.9999744296073914}, {'center': [19444.0, 1023.5], 'digit': 145, 'score': 0.9999983906745911}, {'center': [19815.0, 1027.5], 'digit': 150, 'score': 0.999978244304657}, {'center': [20196.5, 1023.0], 'digit': 155, 'score': 0.9999864101409912}, {'center': [21106.25, 1015.5], 'digit': 155, 'score': 0.9983065128326416}, {'center': [21483.0, 1006.5], 'digit': 160, 'score': 0.9999990463256836}, {'center': [21853.0, 1004.5], 'digit': 165, 'score': 0.9999958872795105}, {'center': [22237.0, 1019.0], 'digit': 170, 'score': 0.9999998211860657}, {'center': [23145.0, 1011.0], 'digit': 170, 'score': 0.9999797940254211}, {'center': [23518.0, 1012.5], 'digit': 175, 'score': 1.0}, {'center': [23887.5, 1018.5], 'digit': 180, 'score': 1.0}, {'center': [24271.5, 1024.5], 'digit': 185, 'score': 1.0}, {'center': [25187.0, 1016.5], 'digit': 185, 'score': 0.9999985694885254}, {'center': [25557.5, 1004.0], 'digit': 190, 'score': 0.9999942779541016}, {'center': [25928.5, 1006.0], 'digit': 195, 'score': 0.9999846816062927}, {'center': [26297.25, 1020.5], 'digit': 200, 'score': 0.9997150301933289}, {'center': [27209.0, 1012.5], 'digit': 200, 'score': 0.9999999403953552}, {'center': [27580.0, 1012.0], 'digit': 205, 'score': 1.0}, {'center': [27942.5, 1015.5], 'digit': 210, 'score': 0.9999999403953552}, {'center': [28321.0, 1020.5], 'digit': 215, 'score': 0.8917851448059082}, {'center': [29253.0, 1018.5], 'digit': 215, 'score': 0.9999648928642273}, {'center': [29622.5, 1008.5], 'digit': 220, 'score': 1.0}, {'center': [30000.75, 1015.0], 'digit': 225, 'score': 0.859564483165741}, {'center': [30364.0, 1027.5], 'digit': 230, 'score': 1.0}, {'center': [31289.0, 1020.5], 'digit': 230, 'score': 1.0}, {'center': [31657.75, 1033.5], 'digit': 235, 'score': 1.0}, {'center': [32023.0, 1041.0], 'digit': 240, 'score': 0.9999995231628418}, {'center': [32391.75, 1059.5], 'digit': 245, 'score': 0.9927439093589783}, {'center': [33325.0, 1056.5], 'digit': 245, 'score': 0.9306972026824951}, {'center': [33702.0, 1044.5], 'digit': 250, 'score': 0.9999999403953552}, 
 {'center': [34062.0, 1038.5], 'digit': 255, 'score': 0.9999999403953552}, {'center': (34383.5, 1016.0), 'digit': 260, 'score': 0.9999382495880127}, {'center': [35335.0, 1022.0], 'digit': 260, 'score': 0.999997615814209}], 10]'''
\ No newline at end of file
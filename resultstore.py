@@ -0,0 +1,296 @@
+import argparse
+import json
+import sqlite3
+from datetime import datetime
+'''对比结果SQLite库: 保存每次对比的人工/智能记录、匹配对和统计快照, 支持跨项目查询'''
+# 默认数据库路径(可修改)
+DEFAULT_DB_PATH = r"E:\Desktop\excelproject\results.db"
+# 评定等级统一写法
+LEVEL_ALIASES = {'III': 'Ⅲ', 'IV': 'Ⅳ', 'II': 'Ⅱ', 'I': 'Ⅰ'}
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    created_at TEXT NOT NULL,
+    segment TEXT,
+    manual_file TEXT,
+    intelligent_file TEXT,
+    output_file TEXT,
+    stats_json TEXT
+);
+CREATE TABLE IF NOT EXISTS records (
+    run_id INTEGER NOT NULL REFERENCES runs(run_id),
+    source TEXT NOT NULL,           -- manual / intelligent
+    row_idx INTEGER NOT NULL,
+    weld_id TEXT NOT NULL,
+    segment TEXT,
+    defect TEXT,
+    keyword TEXT,                   -- 第一个命中的缺欠关键字
+    level TEXT,                     -- 统一为Ⅰ~Ⅳ写法
+    start_pos TEXT,
+    start_mm REAL,
+    length TEXT,
+    matched INTEGER NOT NULL,
+    weld_in_other INTEGER NOT NULL, -- 焊口编号是否出现在另一张表中
+    PRIMARY KEY (run_id, source, row_idx)
+);
+CREATE TABLE IF NOT EXISTS matches (
+    run_id INTEGER NOT NULL REFERENCES runs(run_id),
+    manual_idx INTEGER,
+    intelligent_idx INTEGER,
+    matched INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS stats (
+    run_id INTEGER NOT NULL REFERENCES runs(run_id),
+    name TEXT NOT NULL,
+    value REAL,
+    PRIMARY KEY (run_id, name)
+);
+CREATE INDEX IF NOT EXISTS idx_records_weld ON records(weld_id);
+CREATE INDEX IF NOT EXISTS idx_records_keyword ON records(keyword, level);
+CREATE INDEX IF NOT EXISTS idx_records_level ON records(level);
+CREATE INDEX IF NOT EXISTS idx_records_segment ON records(segment, source, matched);
+CREATE INDEX IF NOT EXISTS idx_matches_run ON matches(run_id);
+CREATE INDEX IF NOT EXISTS idx_runs_created ON runs(created_at);
+'''
+
+def normalize_level(level):
+    level = str(level).strip()
+    if level in ('', 'nan', 'None'):
+        return ''
+    return LEVEL_ALIASES.get(level.upper(), level)
+
+class ResultStore:
+    """对比结果库, 一个ExcelComparer.run对应一条runs记录"""
+
+    def __init__(self, db_path=DEFAULT_DB_PATH):
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def _records(self, comparer, df, source, run_id, segment, matched_set, other_welds):
+        """把一张表转换为records行"""
+        n = len(df)
+        welds = df['焊口编号'].astype(str).tolist()
+        defects = df['缺欠性质'].astype(str).tolist()
+        starts = df['缺欠起始位置（mm）'].astype(str).tolist() if '缺欠起始位置（mm）' in df else [''] * n
+        lengths = df['缺欠长度（mm/点）'].astype(str).tolist() if '缺欠长度（mm/点）' in df else [''] * n
+        levels = df['评定等级'].astype(str).tolist() if '评定等级' in df else [''] * n
+        # 多线路段加载时每条记录自带线路段标记, 否则使用本次对比的线路段
+        segments = df['_segment'].astype(str).tolist() if '_segment' in df else [segment] * n
+
+        rows = []
+        for idx in range(n):
+            keyword = next((kw for kw in comparer.defect_keywords if kw in defects[idx]), '')
+            rows.append((run_id, source, idx, welds[idx], segments[idx], defects[idx], keyword,
+                         normalize_level(levels[idx]), starts[idx], comparer.extract_start_position(starts[idx]),
+                         lengths[idx], int(idx in matched_set), int(welds[idx] in other_welds)))
+        return rows
+
+    def save_run(self, comparer, manual_path, intelligent_path, output_path=None, segment=None, stats=None):
+        """保存一次对比(需已执行compare_data), 返回run_id"""
+        if segment is None:
+            segment = comparer.segment_from_path(manual_path)
+        if stats is None:
+            stats = comparer.compute_statistics()
+        # 集合只保存数量, 关键字明细展开为 名称.关键字
+        snapshot = {}
+        for name, value in stats.items():
+            if isinstance(value, (set, list)):
+                snapshot[name] = len(value)
+            elif isinstance(value, dict):
+                for kw, count in value.items():
+                    snapshot[f"{name}.{kw}"] = count
+            else:
+                snapshot[name] = value
+
+        manual_matched = set()
+        intelligent_matched = set()
+        for result in comparer.match_results:
+            if result['matched']:
+                if result['manual_idx'] is not None:
+                    manual_matched.add(result['manual_idx'])
+                if result['intelligent_idx'] is not None:
+                    intelligent_matched.add(result['intelligent_idx'])
+        manual_welds = set(comparer.manual_data['焊口编号'].astype(str))
+        intelligent_welds = set(comparer.intelligent_data['焊口编号'].astype(str))
+
+        with self.conn:
+            cur = self.conn.execute(
+                'INSERT INTO runs (created_at, segment, manual_file, intelligent_file, output_file, stats_json) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (datetime.now().isoformat(timespec='seconds'), segment, str(manual_path), str(intelligent_path),
+                 str(output_path or ''), json.dumps(snapshot, ensure_ascii=False)))
+            run_id = cur.lastrowid
+
+            insert_record = 'INSERT INTO records VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)'
+            self.conn.executemany(insert_record, self._records(
+                comparer, comparer.manual_data, 'manual', run_id, segment, manual_matched, intelligent_welds))
+            self.conn.executemany(insert_record, self._records(
+                comparer, comparer.intelligent_data, 'intelligent', run_id, segment, intelligent_matched,
+                manual_welds))
+            self.conn.executemany(
+                'INSERT INTO matches VALUES (?, ?, ?, ?)',
+                [(run_id, r['manual_idx'], r['intelligent_idx'], int(r['matched'])) for r in comparer.match_results])
+            self.conn.executemany('INSERT INTO stats VALUES (?, ?, ?)',
+                                  [(run_id, name, value) for name, value in snapshot.items()])
+        return run_id
+
+    def runs(self, segment=None, since=None, until=None):
+        """列出对比记录, since/until为ISO日期字符串"""
+        sql = 'SELECT run_id, created_at, segment, manual_file, intelligent_file, output_file FROM runs WHERE 1=1'
+        params = []
+        if segment:
+            sql += ' AND segment = ?'
+            params.append(segment)
+        if since:
+            sql += ' AND created_at >= ?'
+            params.append(since)
+        if until:
+            sql += ' AND created_at < ?'
+            params.append(until)
+        return [dict(row) for row in self.conn.execute(sql + ' ORDER BY run_id', params)]
+
+    def query_records(self, source=None, matched=None, levels=None, keywords=None, segment=None, weld_id=None,
+                      run_id=None, since=None, until=None, weld_in_other=None, latest_only=False):
+        """
+        按条件查询缺欠记录
+        weld_id支持SQL通配符%
+        latest_only=True时同一条记录(同一源文件的同一行)只取满足条件的最近一次对比,
+        再按matched过滤, 避免每次对比重复保存的人工表在多次对比中重复出现
+        """
+        conditions = []
+        params = []
+        if source:
+            conditions.append('r.source = ?')
+            params.append(source)
+        if weld_in_other is not None:
+            conditions.append('r.weld_in_other = ?')
+            params.append(int(bool(weld_in_other)))
+        if levels:
+            levels = [normalize_level(level) for level in levels]
+            conditions.append(f"r.level IN ({','.join('?' * len(levels))})")
+            params.extend(levels)
+        if keywords:
+            conditions.append(f"r.keyword IN ({','.join('?' * len(keywords))})")
+            params.extend(keywords)
+        if segment:
+            conditions.append('r.segment = ?')
+            params.append(segment)
+        if weld_id:
+            conditions.append('r.weld_id LIKE ?' if '%' in weld_id else 'r.weld_id = ?')
+            params.append(weld_id)
+        if run_id is not None:
+            conditions.append('r.run_id = ?')
+            params.append(run_id)
+        if since:
+            conditions.append('runs.created_at >= ?')
+            params.append(since)
+        if until:
+            conditions.append('runs.created_at < ?')
+            params.append(until)
+        where = ' AND '.join(conditions) or '1=1'
+
+        # 记录以 (来源文件, 来源, 行号) 区分: 人工记录的来源文件为人工表, 智能记录为智能表
+        sql = ('WITH f AS (SELECT r.*, runs.created_at, '
+               "CASE r.source WHEN 'manual' THEN runs.manual_file ELSE runs.intelligent_file END AS source_file "
+               f'FROM records r JOIN runs ON runs.run_id = r.run_id WHERE {where})')
+        if latest_only:
+            sql += (', latest AS (SELECT source_file, source, row_idx, MAX(run_id) AS run_id FROM f '
+                    'GROUP BY source_file, source, row_idx) '
+                    'SELECT f.* FROM f JOIN latest USING (source_file, source, row_idx, run_id) WHERE 1=1')
+        else:
+            sql += ' SELECT f.* FROM f WHERE 1=1'
+        if matched is not None:
+            sql += ' AND f.matched = ?'
+            params.append(int(bool(matched)))
+        sql += ' ORDER BY f.run_id, f.weld_id, f.source, f.row_idx'
+        columns = ['run_id', 'created_at', 'segment', 'source', 'row_idx', 'weld_id', 'defect', 'keyword',
+                   'level', 'start_pos', 'length', 'matched']
+        return [{name: row[name] for name in columns} for row in self.conn.execute(sql, params)]
+
+    def missed_defects(self, levels=('Ⅲ', 'Ⅳ'), segment=None, since=None, until=None, keywords=None,
+                       latest_only=True):
+        """
+        智能系统漏检的人工缺欠: 人工记录未匹配, 且该焊口出现在智能表中
+        默认每条人工记录只按其最近一次对比判断, latest_only=False时列出每次对比中的漏检
+        """
+        return self.query_records(source='manual', matched=False, levels=levels, keywords=keywords,
+                                  segment=segment, since=since, until=until, weld_in_other=True,
+                                  latest_only=latest_only)
+
+    def stats_history(self, name, segment=None):
+        """某项统计值随对比次数的变化"""
+        sql = ('SELECT runs.run_id, runs.created_at, runs.segment, stats.value FROM stats '
+               'JOIN runs ON runs.run_id = stats.run_id WHERE stats.name = ?')
+        params = [name]
+        if segment:
+            sql += ' AND runs.segment = ?'
+            params.append(segment)
+        return [dict(row) for row in self.conn.execute(sql + ' ORDER BY runs.run_id', params)]
+
+def print_rows(rows):
+    """以制表符分隔输出查询结果"""
+    if not rows:
+        print("(无记录)")
+        return
+    print('\t'.join(rows[0].keys()))
+    for row in rows:
+        print('\t'.join('' if v is None else str(v) for v in row.values()))
+    print(f"共 {len(rows)} 条")
+
+def main():
+    parser = argparse.ArgumentParser(description='对比结果库查询')
+    parser.add_argument('--db', default=DEFAULT_DB_PATH, help='数据库路径')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p_runs = sub.add_parser('runs', help='列出对比记录')
+    p_runs.add_argument('--segment')
+    p_runs.add_argument('--since', help='起始日期, 如 2026-07-01')
+    p_runs.add_argument('--until', help='截止日期(不含)')
+
+    p_missed = sub.add_parser('missed', help='智能系统漏检的人工缺欠')
+    p_missed.add_argument('--level', nargs='+', default=['Ⅲ', 'Ⅳ'])
+    p_missed.add_argument('--keyword', nargs='+')
+    p_missed.add_argument('--segment')
+    p_missed.add_argument('--since')
+    p_missed.add_argument('--until')
+    p_missed.add_argument('--all-runs', action='store_true', help='列出每次对比中的漏检(默认每条人工记录只看最近一次对比)')
+
+    p_query = sub.add_parser('query', help='按条件查询缺欠记录')
+    p_query.add_argument('--source', choices=['manual', 'intelligent'])
+    p_query.add_argument('--matched', type=int, choices=[0, 1])
+    p_query.add_argument('--level', nargs='+')
+    p_query.add_argument('--keyword', nargs='+')
+    p_query.add_argument('--segment')
+    p_query.add_argument('--weld', help='焊口编号, 可用%通配')
+    p_query.add_argument('--run', type=int)
+    p_query.add_argument('--since')
+    p_query.add_argument('--until')
+
+    p_stats = sub.add_parser('stats', help='统计值历史')
+    p_stats.add_argument('name', help='统计项, 如 yellow_records 或 manual_keyword_details.圆')
+    p_stats.add_argument('--segment')
+
+    args = parser.parse_args()
+    store = ResultStore(args.db)
+    try:
+        if args.command == 'runs':
+            print_rows(store.runs(args.segment, args.since, args.until))
+        elif args.command == 'missed':
+            print_rows(store.missed_defects(args.level, args.segment, args.since, args.until, args.keyword,
+                                            not args.all_runs))
+        elif args.command == 'query':
+            print_rows(store.query_records(args.source, args.matched, args.level, args.keyword, args.segment,
+                                           args.weld, args.run, args.since, args.until))
+        elif args.command == 'stats':
+            print_rows(store.stats_history(args.name, args.segment))
+    finally:
+        store.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,199 @@
+import argparse
+import csv
+import time
+'''
+参数扫描: 人工/智能数据只加载一次, 在一组位置误差和关键字配置上评估对比结果
+候选匹配对按最大误差和所有关键字的并集只计算一次, 每个配置在候选对上按compare_data的
+贪心规则重新分配, 只输出计数表, 不生成带颜色的工作簿
+'''
+
+# ==================== 配置区域 ====================
+DEFAULT_TOLERANCES = [10, 15, 20, 25, 30]  # 默认扫描的位置误差(mm)
+YELLOW_LEVELS = ('Ⅲ', 'Ⅳ', 'III', 'IV')  # 未匹配时标黄的评定等级
+# ==================================================
+
+class ParameterSweep:
+    """
+    在已加载人工/智能数据的ExcelComparer上做参数扫描
+    每个配置的结果与设置 position_tolerance/defect_keywords 后执行compare_data、compute_statistics一致
+    """
+
+    def __init__(self, comparer):
+        self.comparer = comparer
+        self.candidates = None
+        self.candidate_key = None
+        self.extract_records()
+
+    def extract_records(self):
+        """取出匹配用到的字段, 位置只解析一次"""
+        comparer = self.comparer
+        manual = comparer.manual_data
+        intelligent = comparer.intelligent_data
+
+        self.manual_welds = manual['焊口编号'].astype(str).tolist()
+        self.manual_defects = manual['缺欠性质'].astype(str).tolist()
+        self.manual_pos = [comparer.extract_start_position(v) for v in manual['缺欠起始位置（mm）']]
+
+        self.intelligent_welds = intelligent['焊口编号'].astype(str).tolist()
+        self.intelligent_defects = intelligent['缺欠性质'].astype(str).tolist()
+        self.intelligent_pos = [comparer.extract_start_position(v) for v in intelligent['缺欠起始位置（mm）']]
+        levels = intelligent['评定等级'] if '评定等级' in intelligent else [''] * len(intelligent)
+        self.intelligent_yellow = [str(level) in YELLOW_LEVELS for level in levels]
+
+        # 与build_manual_index一致: "未见"按缺欠性质原文判断, 与关键字配置无关
+        self.manual_by_weld = {}
+        self.manual_unseen = {}
+        for m_idx, weld_id in enumerate(self.manual_welds):
+            self.manual_by_weld.setdefault(weld_id, []).append(m_idx)
+            if "未见" in self.manual_defects[m_idx]:
+                self.manual_unseen.setdefault(weld_id, []).append(m_idx)
+        self.intelligent_weld_set = set(self.intelligent_welds)
+
+    def prepare(self, max_tolerance, keywords):
+        """
+        计算候选匹配对: 同一焊口、共有关键字且位置误差不超过max_tolerance的人工记录
+        candidates[i_idx][kw] = [(m_idx, 误差), ...], 保持人工表顺序
+        """
+        key = (max_tolerance, tuple(keywords))
+        if self.candidate_key == key:
+            return
+        candidates = []
+        for i_idx, weld_id in enumerate(self.intelligent_welds):
+            by_keyword = {}
+            i_pos = self.intelligent_pos[i_idx]
+            i_keywords = [kw for kw in keywords if kw in self.intelligent_defects[i_idx]]
+            if i_pos is not None and i_keywords:
+                for m_idx in self.manual_by_weld.get(weld_id, []):
+                    m_pos = self.manual_pos[m_idx]
+                    if m_pos is None:
+                        continue
+                    distance = abs(i_pos - m_pos)
+                    if distance > max_tolerance:
+                        continue
+                    for kw in i_keywords:
+                        if kw in self.manual_defects[m_idx]:
+                            by_keyword.setdefault(kw, []).append((m_idx, distance))
+            candidates.append(by_keyword)
+        self.candidates = candidates
+        self.candidate_key = key
+
+    def evaluate(self, tolerance, keywords):
+        """按compare_data的顺序和规则在候选对上分配匹配, 返回该配置的统计行"""
+        manual_matched = set()
+        intelligent_matched = set()
+
+        for i_idx, weld_id in enumerate(self.intelligent_welds):
+            # "未见": 同焊口自动匹配, 每个人工记录只匹配一次
+            unseen = self.manual_unseen.get(weld_id)
+            if unseen:
+                for m_idx in unseen:
+                    if m_idx not in manual_matched:
+                        manual_matched.add(m_idx)
+                        intelligent_matched.add(i_idx)
+                if i_idx in intelligent_matched:
+                    continue
+
+            by_keyword = self.candidates[i_idx]
+            if not by_keyword:
+                continue
+            defect = self.intelligent_defects[i_idx]
+            for kw in keywords:
+                if kw not in defect:
+                    continue
+                m_idx = next((m for m, distance in by_keyword.get(kw, ()) if distance <= tolerance), None)
+                if m_idx is not None:
+                    manual_matched.add(m_idx)
+                    intelligent_matched.add(i_idx)
+                    break
+
+        matched_welds = {self.intelligent_welds[i] for i in intelligent_matched}
+        yellow = sum(1 for i, is_yellow in enumerate(self.intelligent_yellow)
+                     if is_yellow and i not in intelligent_matched)
+        red = sum(1 for m, weld_id in enumerate(self.manual_welds)
+                  if m not in manual_matched and weld_id in self.intelligent_weld_set)
+
+        # 人工表关键字统计(统计报告第四、五条): 每条记录计入第一个命中的关键字
+        totals = {kw: 0 for kw in keywords}
+        hits = {kw: 0 for kw in keywords}
+        for m_idx, defect in enumerate(self.manual_defects):
+            kw = next((kw for kw in keywords if kw in defect), None)
+            if kw is None:
+                continue
+            if self.manual_welds[m_idx] in self.intelligent_weld_set:
+                totals[kw] += 1
+            if m_idx in manual_matched:
+                hits[kw] += 1
+
+        return {
+            '位置误差': tolerance,
+            '关键字': ','.join(keywords),
+            '匹配对数': len(intelligent_matched),
+            '匹配焊口数': len(matched_welds),
+            '标黄记录数': yellow,
+            '标红记录数': red,
+            '人工关键字记录数': sum(totals.values()),
+            '人工关键字匹配数': sum(hits.values()),
+            '关键字明细': '、'.join(f"{kw}-{hits[kw]}/{totals[kw]}" for kw in keywords if totals[kw] or hits[kw]),
+        }
+
+    def run(self, tolerances, keyword_sets):
+        """评估 误差 x 关键字配置 的所有组合, 返回统计行列表"""
+        union = []
+        for keywords in keyword_sets:
+            union.extend(kw for kw in keywords if kw not in union)
+        t0 = time.perf_counter()
+        self.prepare(max(tolerances), union)
+        print(f"候选匹配对计算完成, 用时 {time.perf_counter() - t0:.2f}s")
+
+        rows = []
+        for keywords in keyword_sets:
+            for tolerance in tolerances:
+                rows.append(self.evaluate(tolerance, keywords))
+        return rows
+
+def parse_keyword_set(value, default):
+    """关键字配置: 逗号分隔的关键字, "default"表示ExcelComparer的默认关键字"""
+    if value == 'default':
+        return list(default)
+    return [kw.strip() for kw in value.split(',') if kw.strip()]
+
+def print_table(rows):
+    """以制表符分隔输出扫描结果"""
+    print('\t'.join(rows[0].keys()))
+    for row in rows:
+        print('\t'.join(str(v) for v in row.values()))
+
+def write_csv(rows, path):
+    with open(path, 'w', newline='', encoding='utf-8-sig') as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0].keys()))
+        writer.writeheader()
+        writer.writerows(rows)
+    print(f"扫描结果已保存: {path}")
+
+def main():
+    from excelproject import ExcelComparer, MANUAL_FILE_PATH, INTELLIGENT_FILE_PATH
+
+    parser = argparse.ArgumentParser(description='位置误差和关键字配置参数扫描')
+    parser.add_argument('--manual', default=MANUAL_FILE_PATH, help='人工评判标准文件路径')
+    parser.add_argument('--intelligent', default=INTELLIGENT_FILE_PATH, help='智能评判结果文件路径')
+    parser.add_argument('--tolerance', type=float, nargs='+', default=DEFAULT_TOLERANCES, help='位置误差(mm)')
+    parser.add_argument('--keywords', action='append',
+                        help='关键字配置, 逗号分隔, 可重复指定; "default"为默认关键字')
+    parser.add_argument('--csv', help='把结果另存为CSV')
+    args = parser.parse_args()
+
+    comparer = ExcelComparer()
+    comparer.manual_data = comparer.load_excel_data(args.manual)
+    comparer.intelligent_data = comparer.load_excel_data(args.intelligent)
+    keyword_sets = [parse_keyword_set(v, comparer.defect_keywords) for v in (args.keywords or ['default'])]
+
+    tolerances = [int(t) if t == int(t) else t for t in args.tolerance]
+
+    rows = ParameterSweep(comparer).run(tolerances, keyword_sets)
+    print()
+    print_table(rows)
+    if args.csv:
+        write_csv(rows, args.csv)
+
+if __name__ == '__main__':
+    main()
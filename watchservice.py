@@ -0,0 +1,224 @@
+import argparse
+import json
+import os
+import time
+import traceback
+from datetime import datetime
+'''
+常驻监视服务: 监视输入文件夹, 新的智能评判导出文件落地后自动与人工评判标准对比
+人工数据和索引常驻内存, 只在人工文件修改后重新加载;
+pandas/openpyxl等重量级模块在预热时才导入, 命令行启动和参数检查不付这部分开销
+'''
+
+# ==================== 配置区域 ====================
+MANUAL_FILE_PATH = r"E:\Desktop\连仪段_施工数字射线检测数据移交模板.xlsx"  # 人工评判标准文件路径
+WATCH_DIR = r"E:\Desktop\excelproject\inbox"  # 智能评判结果导出文件夹
+OUTPUT_DIR = r"E:\Desktop\excelproject\outbox"  # 对比结果输出文件夹
+RESULT_DB_PATH = None  # 结果库路径(SQLite); None表示不保存
+POLL_INTERVAL = 5  # 轮询间隔(秒)
+WATCH_EXTENSIONS = ('.xlsx', '.xls', '.csv')  # 监视的文件类型
+OUTPUT_SUFFIX = '_对比结果.xlsx'  # 输出文件名后缀
+STATE_FILE_NAME = 'watch_state.json'  # 已处理文件记录, 保存在输出文件夹
+MAX_ATTEMPTS = 3  # 同一文件(大小和修改时间不变)处理失败后的最多尝试次数
+# ==================================================
+
+class WatchService:
+    def __init__(self, manual_path, watch_dir, output_dir, store_path=None, interval=POLL_INTERVAL):
+        self.manual_path = manual_path
+        self.watch_dir = watch_dir
+        self.output_dir = output_dir
+        self.store_path = store_path
+        self.interval = interval
+        self.comparer = None
+        self.manual_mtime = None
+        self.state_path = os.path.join(output_dir, STATE_FILE_NAME)
+        self.state = {}
+        # 上一轮扫描到的 文件名 -> (大小, 修改时间), 连续两轮不变才认为写入完成
+        self.last_seen = {}
+
+    def load_state(self):
+        """读取已处理文件记录"""
+        if os.path.exists(self.state_path):
+            try:
+                with open(self.state_path, 'r', encoding='utf-8') as f:
+                    self.state = json.load(f)
+            except:
+                print(f"警告: 无法读取处理记录 {self.state_path}, 将重新处理所有文件")
+                self.state = {}
+
+    def save_state(self):
+        """先写临时文件再替换, 避免中断时记录文件损坏"""
+        tmp_path = self.state_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.state, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.state_path)
+
+    def warm_up(self):
+        """导入重量级模块并加载人工数据、建立索引"""
+        t0 = time.perf_counter()
+        from excelproject import ExcelComparer
+
+        self.comparer = ExcelComparer()
+        self.reload_manual()
+        print(f"预热完成, 用时 {time.perf_counter() - t0:.2f}s")
+
+    def reload_manual(self):
+        """人工文件修改后重新加载, 否则沿用内存中的数据和索引; 返回是否重新加载"""
+        mtime = os.path.getmtime(self.manual_path)
+        if self.manual_mtime == mtime:
+            return False
+        self.comparer.manual_data = self.comparer.load_excel_data(self.manual_path)
+        self.comparer.invalidate_manual_index()
+        self.comparer.build_manual_index()
+        self.manual_mtime = mtime
+        return True
+
+    def is_candidate(self, name):
+        """是否为需要处理的智能评判导出文件"""
+        if name.startswith('~$') or name.startswith('.'):
+            return False
+        if name.endswith(OUTPUT_SUFFIX):
+            return False
+        return name.lower().endswith(WATCH_EXTENSIONS)
+
+    def scan(self):
+        """扫描监视文件夹, 返回 文件名 -> (大小, 修改时间)"""
+        manual_abs = os.path.abspath(self.manual_path)
+        found = {}
+        with os.scandir(self.watch_dir) as it:
+            for entry in it:
+                if not entry.is_file() or not self.is_candidate(entry.name):
+                    continue
+                if os.path.abspath(entry.path) == manual_abs:
+                    continue
+                st = entry.stat()
+                found[entry.name] = (st.st_size, st.st_mtime)
+        return found
+
+    def pending_files(self, wait_stable=True):
+        """
+        返回待处理的文件名列表(按修改时间排序)
+        未处理过、处理后又被修改、或处理失败且尝试次数未超过MAX_ATTEMPTS的文件才需要处理;
+        wait_stable=True时要求大小和修改时间连续两轮扫描不变, 避免读到写了一半的文件
+        """
+        found = self.scan()
+        pending = []
+        for name, sig in found.items():
+            done = self.state.get(name)
+            if done and (done['size'], done['mtime']) == sig:
+                # 失败多为暂时性原因(文件被Excel占用、复制未完成), 允许有限次重试
+                if done['ok'] or done.get('attempts', 1) >= MAX_ATTEMPTS:
+                    continue
+            if wait_stable and self.last_seen.get(name) != sig:
+                continue
+            pending.append(name)
+        self.last_seen = found
+        return sorted(pending, key=lambda n: found[n][1])
+
+    def output_path_for(self, name):
+        stem = os.path.splitext(name)[0]
+        return os.path.join(self.output_dir, stem + OUTPUT_SUFFIX)
+
+    def process(self, name):
+        """对比单个智能评判文件, 输出结果并记录处理状态; 出错只记录, 不中断服务"""
+        path = os.path.join(self.watch_dir, name)
+        output_path = self.output_path_for(name)
+        st = os.stat(path)
+        t0 = time.perf_counter()
+        print("\n" + "-" * 100)
+        print(f"检测到新文件: {name}")
+
+        previous = self.state.get(name)
+        attempts = 1
+        if previous and not previous['ok'] and (previous['size'], previous['mtime']) == (st.st_size, st.st_mtime):
+            attempts = previous.get('attempts', 1) + 1
+        record = {
+            'size': st.st_size,
+            'mtime': st.st_mtime,
+            'attempts': attempts,
+            'processed_at': datetime.now().isoformat(timespec='seconds'),
+            'output': output_path,
+        }
+        comparer = self.comparer
+        try:
+            if self.reload_manual():
+                print("人工评判标准文件已更新, 已重新加载")
+            comparer.intelligent_data = comparer.load_excel_data(path)
+            comparer.compare_data()
+            comparer.generate_output_file(output_path)
+            stats = comparer.compute_statistics()
+            comparer.generate_statistics_report(stats)
+            if self.store_path:
+                comparer.save_to_store(self.store_path, self.manual_path, path, output_path)
+            record['ok'] = True
+            record['matched'] = sum(1 for r in comparer.match_results if r['matched'])
+            record['matched_welds'] = len(stats['matched_intelligent_welds'])
+            record['yellow_records'] = stats['yellow_records']
+        except Exception as e:
+            print(f"\n错误: 处理 {name} 失败: {str(e)}")
+            traceback.print_exc()
+            record['ok'] = False
+            record['error'] = str(e)
+        finally:
+            # 智能数据不常驻, 处理完即释放
+            comparer.intelligent_data = None
+
+        record['elapsed'] = round(time.perf_counter() - t0, 3)
+        self.state[name] = record
+        self.save_state()
+        status = '完成' if record['ok'] else '失败'
+        print(f"{name} 处理{status}, 用时 {record['elapsed']:.2f}s")
+        return record['ok']
+
+    def run_once(self):
+        """处理文件夹中当前所有未处理的文件后返回, 返回处理的文件数"""
+        names = self.pending_files(wait_stable=False)
+        for name in names:
+            self.process(name)
+        return len(names)
+
+    def run_forever(self):
+        """持续轮询监视文件夹, Ctrl+C退出"""
+        print(f"开始监视: {self.watch_dir} (间隔 {self.interval}s, Ctrl+C退出)")
+        try:
+            while True:
+                try:
+                    for name in self.pending_files():
+                        self.process(name)
+                except Exception as e:
+                    # 文件夹暂时不可访问等情况, 下一轮重试
+                    print(f"警告: 扫描监视文件夹失败: {e}")
+                time.sleep(self.interval)
+        except KeyboardInterrupt:
+            print("\n监视服务已停止")
+
+    def start(self, once=False):
+        os.makedirs(self.output_dir, exist_ok=True)
+        self.load_state()
+        self.warm_up()
+        if once:
+            count = self.run_once()
+            print(f"\n本次共处理 {count} 个文件")
+        else:
+            self.run_forever()
+
+def main():
+    parser = argparse.ArgumentParser(description='监视智能评判导出文件夹, 自动与人工评判标准对比')
+    parser.add_argument('--manual', default=MANUAL_FILE_PATH, help='人工评判标准文件路径')
+    parser.add_argument('--watch', default=WATCH_DIR, help='智能评判结果导出文件夹')
+    parser.add_argument('--output', default=OUTPUT_DIR, help='对比结果输出文件夹')
+    parser.add_argument('--db', default=RESULT_DB_PATH, help='结果库路径(SQLite), 不指定则不保存')
+    parser.add_argument('--interval', type=float, default=POLL_INTERVAL, help='轮询间隔(秒)')
+    parser.add_argument('--once', action='store_true', help='处理完当前文件后退出, 不持续监视')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.manual):
+        parser.error(f'人工评判标准文件不存在: {args.manual}')
+    if not os.path.isdir(args.watch):
+        parser.error(f'监视文件夹不存在: {args.watch}')
+
+    service = WatchService(args.manual, args.watch, args.output, args.db, args.interval)
+    service.start(once=args.once)
+
+if __name__ == '__main__':
+    main()